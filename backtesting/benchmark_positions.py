@@ -0,0 +1,69 @@
+"""
+Benchmark of positions calculation - pandas loc / ffill columns
+against NumPy calculate_positions
+
+python benchmark_positions.py --n_bars 1000000
+"""
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import technicals
+
+
+def pandas_positions(data: pd.DataFrame) -> pd.Series:
+    """ Previous BaseTechnicalsBacktester implementation """
+    data['Long'] = np.nan
+    data.loc[data['Long_enter'], 'Long'] = 1
+    data.loc[data['Long_exit'], 'Long'] = 0
+    data['Short'] = np.nan
+    data.loc[data['Short_enter'], 'Short'] = -1
+    data.loc[data['Short_exit'], 'Short'] = 0
+
+    for position in ['Long', 'Short']:
+        data.iloc[0, data.columns.get_loc(position)] = 0
+        data[position] = data[position].fillna(method='ffill')
+
+    return data['Long'] + data['Short']
+
+
+def numpy_positions(data: pd.DataFrame) -> np.ndarray:
+    return technicals.calculate_positions(
+        long_enter=data['Long_enter'].values,
+        long_exit=data['Long_exit'].values,
+        short_enter=data['Short_enter'].values,
+        short_exit=data['Short_exit'].values)
+
+
+def main(n_bars: int, n_repeats: int, signal_probability: float):
+    random_state = np.random.RandomState(0)
+    data = pd.DataFrame(
+        random_state.rand(n_bars, 4) < signal_probability,
+        columns=['Long_enter', 'Long_exit', 'Short_enter', 'Short_exit'],
+        index=pd.date_range('2010-01-01', periods=n_bars, freq='1T'))
+
+    if not np.array_equal(pandas_positions(data.copy()).values,
+                          numpy_positions(data)):
+        raise AssertionError('Positions are different!')
+
+    pandas_time = min(timeit.repeat(
+        lambda: pandas_positions(data.copy()), number=1, repeat=n_repeats))
+    numpy_time = min(timeit.repeat(
+        lambda: numpy_positions(data), number=1, repeat=n_repeats))
+
+    print(f'Bars: {n_bars}')
+    print(f'pandas loc / ffill: {pandas_time * 1000:.1f} ms')
+    print(f'numpy: {numpy_time * 1000:.1f} ms')
+    print(f'Speedup: {pandas_time / numpy_time:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_bars', type=int, help='Number of bars', default=1000000)
+    parser.add_argument('--n_repeats', type=int, help='Number of timing repeats', default=5)
+    parser.add_argument('--signal_probability', type=float,
+                        help='Probability of every signal on a bar', default=0.01)
+    args = parser.parse_args()
+    main(args.n_bars, args.n_repeats, args.signal_probability)
@@ -0,0 +1,54 @@
+"""
+Incremental export of bars recorded by live bot from MongoDB prices
+collection to numpy stores readable by backtesters ('npstore' source)
+
+Last timestamp of existing store is the high-water mark - only later
+bars are read from MongoDB, so it can be run every night
+
+python export_mongo_prices.py --assets DAX EURUSD GBPUSD --store_dir /data/stores
+"""
+import argparse
+import os
+
+import file_readers
+
+import sys
+sys.path.insert(0, '..')
+from settings import MONGO_HOST
+
+
+def export_prices(host: str, asset: str, store_path: str,
+                  chunk_size: int = 1000000) -> int:
+    """
+    Appends bars of asset recorded since the last export to store
+    :return: number of exported bars
+    """
+    store_end = file_readers.get_numpy_store_end(store_path)
+    reader = file_readers.MongoPricesReader(
+        file_readers.MongoPricesReader.make_path(host, asset), start=store_end)
+
+    # Every chunk is appended as soon as it is read, only one is kept in memory
+    n_exported = 0
+    for new_bars in reader.read_chunks(chunk_size):
+        file_readers.append_to_numpy_store(store_path, new_bars)
+        n_exported += len(new_bars)
+    return n_exported
+
+
+def main(host: str, assets: list, store_dir: str, chunk_size: int):
+    for asset in assets:
+        store_path = os.path.join(
+            store_dir, asset + file_readers.NumpyStoreReader.store_extension)
+        n_exported = export_prices(host, asset, store_path, chunk_size)
+        print(f'{asset}: {n_exported} bars exported to {store_path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, help='MongoDB host', default=MONGO_HOST)
+    parser.add_argument('--assets', type=str, nargs='+', help='Assets to export', required=True)
+    parser.add_argument('--store_dir', type=str, help='Directory of numpy stores', required=True)
+    parser.add_argument('--chunk_size', type=int,
+                        help='Max number of bars read from MongoDB at once', default=1000000)
+    args = parser.parse_args()
+    main(args.host, args.assets, args.store_dir, args.chunk_size)
@@ -7,8 +7,24 @@ Created on Sun Jun 23 18:49:04 2019
 """
 
 import abc
+import json
+import os
+import shutil
+
+import numpy as np
 import pandas as pd
 
+import sys
+sys.path.insert(0, '../data_preprocessing')
+sys.path.insert(0, '..')
+import market_data_preprocessing
+
+
+NUMPY_STORE_MANIFEST = 'manifest.json'
+# Appended chunks are merged into a new base above that, so stores
+# exported every night are still read from a single memory-mapped base
+MAX_NUMPY_STORE_CHUNKS = 8
+
 
 class BaseFileReader:
 
@@ -30,6 +46,28 @@ class BaseFileReader:
     def read_data(self) -> pd.DataFrame:
         pass
 
+    def read_chunks(self, chunk_size: int = 1000000):
+        """
+        Reads data in chunks of chunk_size rows
+        Readers of big files should read it lazily
+        :return: generator of DataFrames with DateTime index
+        """
+        df = self.read_data()
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+    def read_bars(self, interval: str, chunk_size: int = 1000000,
+                  price_column: str = None) -> pd.DataFrame:
+        """
+        Streams file in chunks and aggregates it to OHLC bars,
+        so only one chunk of raw data is kept in memory
+        :param interval: for example '1T', '5T', '1H'
+        :param price_column: tick price column, for example 'Bid'
+        """
+        bars = market_data_preprocessing.resample_chunks_to_ohlc(
+            self.read_chunks(chunk_size), interval, price_column)
+        return pd.concat(list(bars))
+
 
 class UnknownDataReader(BaseFileReader):
 
@@ -52,14 +90,124 @@ class DukascopyCSVReader(BaseFileReader):
     def check_data_source(file_path: str, data_source: str) -> bool:
         return file_path.endswith('.csv') and data_source == 'dukascopy'
 
-    def read_data(self) -> pd.DataFrame:
-        self._fix_path_from_qt()
-        df = pd.read_csv(self._file_path, index_col='Gmt time',
-                         dayfirst=True, parse_dates=True)
+    datetime_format = '%d.%m.%Y %H:%M:%S.%f'
+
+    def _parse_index(self, df: pd.DataFrame) -> pd.DataFrame:
+        try:
+            # Explicit format is much faster than dayfirst inference
+            df.index = pd.to_datetime(df.index, format=self.datetime_format)
+        except ValueError:
+            df.index = pd.to_datetime(df.index, dayfirst=True)
 
         df.index.names = ['Date']
         return df
 
+    def read_data(self) -> pd.DataFrame:
+        self._fix_path_from_qt()
+        df = pd.read_csv(self._file_path, index_col='Gmt time')
+        return self._parse_index(df)
+
+    def read_chunks(self, chunk_size: int = 1000000):
+        self._fix_path_from_qt()
+        for df in pd.read_csv(self._file_path, index_col='Gmt time',
+                              chunksize=chunk_size):
+            yield self._parse_index(df)
+
+
+class NumpyStoreReader(BaseFileReader):
+    """
+    Reads market data converted by convert_to_numpy_store
+    Store is a directory of .npy files, memory-mapped on read - prices
+    are not copied until they are modified. Rows appended later are kept
+    in chunk directories listed in manifest (see append_to_numpy_store)
+    and are concatenated with the base on read, until they are compacted
+    """
+    __slots__ = ()
+
+    store_extension = '.npstore'
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+
+    @staticmethod
+    def check_data_source(file_path: str, data_source: str) -> bool:
+        return file_path.rstrip('/').endswith(NumpyStoreReader.store_extension) \
+               and data_source == 'npstore'
+
+    def read_data(self) -> pd.DataFrame:
+        self._fix_path_from_qt()
+        values, index, columns = _load_numpy_store(self._file_path)
+
+        # Values are saved as (columns, rows) - transposed array is used
+        # by pandas as a single block without copying
+        return pd.DataFrame(
+            values.T, columns=list(columns), copy=False,
+            index=pd.DatetimeIndex(index.view('datetime64[ns]'), name='Date'))
+
+
+class MongoPricesReader(BaseFileReader):
+    """
+    Reads 1 minute bars recorded by live bot to MongoDB prices collection
+    File path is '<Mongo host>#<asset>', see make_path
+    """
+    __slots__ = ('_start', )
+
+    columns = ('Open', 'High', 'Low', 'Close')
+
+    def __init__(self, file_path: str, start: pd.Timestamp = None):
+        """
+        :param start: only bars with later timestamp are read
+        """
+        super().__init__(file_path)
+        self._start = start
+
+    @staticmethod
+    def make_path(host: str, asset: str) -> str:
+        return f'{host}#{asset}'
+
+    @staticmethod
+    def check_data_source(file_path: str, data_source: str) -> bool:
+        return '#' in file_path and data_source == 'mongo'
+
+    def _find_raw_batches(self, batch_size: int):
+        # MongoDB stack is imported only by backtests reading from it
+        import pymongo
+        from databases.mongo.client_registry import get_client
+        from databases.mongo.config import DB_NAME, PRICES_COLLECTION_NAME
+        from databases.mongo.mongo_manager import MongoPricesManager
+
+        host, asset = self._file_path.rsplit('#', 1)
+        query = {'Asset': asset}
+        if self._start is not None:
+            query['Timestamp'] = {'$gt': pd.Timestamp(self._start).to_pydatetime()}
+        projection = dict.fromkeys(MongoPricesManager.fields, 1)
+        projection['_id'] = 0
+
+        collection = get_client(host)[DB_NAME][PRICES_COLLECTION_NAME]
+        return collection.find_raw_batches(query, projection).sort(
+            'Timestamp', pymongo.ASCENDING).batch_size(batch_size)
+
+    def read_data(self) -> pd.DataFrame:
+        chunks = list(self.read_chunks())
+        if not chunks:
+            return pd.DataFrame(columns=self.columns, dtype=np.float64,
+                                index=pd.DatetimeIndex([], name='Date'))
+        return pd.concat(chunks)
+
+    def read_chunks(self, chunk_size: int = 1000000):
+        """
+        Streams bars in time order, one chunk per raw batch of
+        at most chunk_size documents
+        """
+        from databases.mongo.bson_arrays import decode_batch
+        from databases.mongo.mongo_manager import MongoPricesManager
+
+        for batch in self._find_raw_batches(chunk_size):
+            columns = decode_batch(batch, MongoPricesManager.fields)
+            index = pd.DatetimeIndex(columns.pop('Timestamp'), name='Date')
+            if len(index):
+                yield pd.DataFrame(columns, index=index, columns=self.columns)
+
 
 class FileReaderFactory:
 
@@ -80,3 +228,186 @@ class FileReaderFactory:
 
         return UnknownDataReader(self._file_path)
 
+
+def convert_to_numpy_store(file_path: str, file_source: str,
+                           store_path: str = None,
+                           dtype=np.float64) -> str:
+    """
+    Parses market data file once and saves it as columnar numpy store,
+    readable with 'npstore' data source
+    :param file_path: full path to file like '/home/user/dir/EURUSD.csv'
+    :param file_source: for example 'dukascopy'
+    :param store_path: store directory, by default file path with
+    '.npstore' extension
+    :param dtype: prices dtype - np.float64 or np.float32
+    :return: store directory path
+    """
+    market_data = FileReaderFactory(file_path, file_source).get_file_reader().read_data()
+    if store_path is None:
+        store_path = os.path.splitext(file_path)[0] + NumpyStoreReader.store_extension
+    _save_numpy_store(store_path, market_data.select_dtypes(include=[np.number]), dtype)
+    return store_path
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    """ Saves array and syncs it to disk """
+    with open(path, 'wb') as file:
+        np.save(file, array)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _save_numpy_store(store_path: str, market_data: pd.DataFrame, dtype,
+                      save_columns: bool = True) -> None:
+    os.makedirs(store_path, exist_ok=True)
+    _save_array(os.path.join(store_path, 'values.npy'),
+                np.ascontiguousarray(market_data.values.T, dtype=dtype))
+    _save_array(os.path.join(store_path, 'index.npy'),
+                market_data.index.values.astype('datetime64[ns]').view(np.int64))
+    if save_columns:
+        _save_array(os.path.join(store_path, 'columns.npy'),
+                    np.array(market_data.columns, dtype=str))
+
+
+def _get_numpy_store_manifest(store_path: str) -> dict:
+    """
+    Returns store manifest - base directory ('' is store directory itself)
+    and chunk directories appended to it
+    """
+    manifest_path = os.path.join(store_path, NUMPY_STORE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {'base': '', 'chunks': list()}
+    with open(manifest_path) as manifest:
+        return json.load(manifest)
+
+
+def _save_numpy_store_manifest(store_path: str, manifest: dict) -> None:
+    """ Replaces manifest atomically - directory is a part of store once it is listed """
+    manifest_path = os.path.join(store_path, NUMPY_STORE_MANIFEST)
+    temporary_path = manifest_path + '.tmp'
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(temporary_path, manifest_path)
+
+
+def _load_numpy_store(store_path: str) -> tuple:
+    """
+    Returns values (columns, rows), int64 index and columns of store
+    Arrays are memory-mapped, unless chunks have to be concatenated
+    """
+    manifest = _get_numpy_store_manifest(store_path)
+    base_path = os.path.join(store_path, manifest['base'])
+    values = np.load(os.path.join(base_path, 'values.npy'), mmap_mode='r')
+    index = np.load(os.path.join(base_path, 'index.npy'), mmap_mode='r')
+    columns = np.load(os.path.join(base_path, 'columns.npy'))
+
+    if manifest['chunks']:
+        chunk_paths = [os.path.join(store_path, chunk) for chunk in manifest['chunks']]
+        values = np.concatenate(
+            [values] + [np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+                        for path in chunk_paths], axis=1)
+        index = np.concatenate(
+            [index] + [np.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+                       for path in chunk_paths])
+    return values, index, columns
+
+
+def _remove_unlisted_numpy_store_files(store_path: str, manifest: dict) -> None:
+    """ Removes base and chunks left by interrupted appends or compactions """
+    listed = set(manifest['chunks'])
+    listed.add(manifest['base'])
+    for name in os.listdir(store_path):
+        path = os.path.join(store_path, name)
+        if os.path.isdir(path) and name not in listed:
+            shutil.rmtree(path)
+        elif name.endswith('.npy') and manifest['base']:
+            # Base of store before its first compaction
+            os.remove(path)
+
+
+def _compact_numpy_store(store_path: str, manifest: dict) -> None:
+    """
+    Merges base and chunks to a new base directory, which replaces them
+    by atomic replace of manifest
+    """
+    values, index, columns = _load_numpy_store(store_path)
+    n_compactions = int(manifest['base'].rsplit('_', 1)[-1]) + 1 if manifest['base'] else 0
+    base = f'base_{n_compactions:06d}'
+    base_path = os.path.join(store_path, base)
+    os.makedirs(base_path)
+    _save_array(os.path.join(base_path, 'values.npy'), np.ascontiguousarray(values))
+    _save_array(os.path.join(base_path, 'index.npy'), np.asarray(index))
+    _save_array(os.path.join(base_path, 'columns.npy'), columns)
+
+    compacted_manifest = {'base': base, 'chunks': list()}
+    _save_numpy_store_manifest(store_path, compacted_manifest)
+    _remove_unlisted_numpy_store_files(store_path, compacted_manifest)
+
+
+def get_numpy_store_end(store_path: str) -> pd.Timestamp:
+    """ Returns timestamp of last row in store or None if store does not exist """
+    manifest = _get_numpy_store_manifest(store_path)
+    index_path = os.path.join(store_path, manifest['base'], 'index.npy')
+    if not os.path.exists(index_path):
+        return None
+
+    # Chunks hold only later rows, so the last non empty one has the end
+    index_paths = [index_path] + [os.path.join(store_path, chunk, 'index.npy')
+                                  for chunk in manifest['chunks']]
+    for path in reversed(index_paths):
+        index = np.load(path, mmap_mode='r')
+        if len(index):
+            return pd.Timestamp(index[-1:].view('datetime64[ns]')[0])
+    return None
+
+
+def append_to_numpy_store(store_path: str, market_data: pd.DataFrame,
+                          dtype=np.float64) -> None:
+    """
+    Appends rows later than the last row of store, creates store if it
+    does not exist. New rows are written as a chunk directory, which is
+    added to store by atomic replace of its manifest - so every append
+    costs only the new rows and readers never see partially written data.
+    Above MAX_NUMPY_STORE_CHUNKS chunks store is compacted to a new base.
+    New store is written to temporary directory and renamed
+    :param market_data: pandas DataFrame with the same columns as store
+    :param dtype: prices dtype of new store, existing store keeps its dtype
+    """
+    store_path = store_path.rstrip('/')
+    temporary_path = store_path + '.tmp'
+    # Leftover of interrupted export
+    shutil.rmtree(temporary_path, ignore_errors=True)
+
+    store_end = get_numpy_store_end(store_path)
+    if store_end is None and os.path.exists(store_path):
+        # Existing store without rows is replaced
+        shutil.rmtree(store_path)
+    if store_end is None:
+        if market_data.empty:
+            return
+        _save_numpy_store(temporary_path, market_data, dtype)
+        os.replace(temporary_path, store_path)
+        return
+
+    manifest = _get_numpy_store_manifest(store_path)
+    _remove_unlisted_numpy_store_files(store_path, manifest)
+    market_data = market_data.loc[market_data.index > store_end]
+    if market_data.empty:
+        return
+
+    base_path = os.path.join(store_path, manifest['base'])
+    columns = list(np.load(os.path.join(base_path, 'columns.npy')))
+    if columns != list(market_data.columns):
+        raise ValueError(f'Cannot append {list(market_data.columns)} columns '
+                         f'to store with {columns} columns!')
+    dtype = np.load(os.path.join(base_path, 'values.npy'), mmap_mode='r').dtype
+
+    chunk = f'chunk_{len(manifest["chunks"]):06d}'
+    _save_numpy_store(os.path.join(store_path, chunk), market_data, dtype, save_columns=False)
+    manifest['chunks'].append(chunk)
+    _save_numpy_store_manifest(store_path, manifest)
+
+    if len(manifest['chunks']) > MAX_NUMPY_STORE_CHUNKS:
+        _compact_numpy_store(store_path, manifest)
@@ -6,6 +6,12 @@ Created on Mon Jul  1 11:23:52 2019
 @author: rafal
 """
 import abc
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+
 import hyperopt
 import numpy as np
 import pandas as pd
@@ -16,6 +22,74 @@ import pandas as pd
 import technicals
 import file_readers
 
+import sys
+sys.path.insert(0, '../data_preprocessing')
+import market_data_preprocessing
+
+
+def calculate_loss(Backtester, params: dict,
+                   market_data_cache: market_data_preprocessing.MarketDataCache,
+                   indicator_cache: technicals.IndicatorCache,
+                   fee: float, priority: str) -> float:
+    """ Backtests single params set, returns loss to minimize """
+    params['fee'] = fee
+    backtester_model = Backtester(**params)
+    backtester_model.fit_from_cache(market_data_cache=market_data_cache,
+                                    indicator_cache=indicator_cache)
+
+    if priority == 'return':
+        return 1 - backtester_model.strategy_return
+    elif priority == 'drawdown':
+        return backtester_model.maximum_drawdown
+
+
+def dump_market_data(market_data: pd.DataFrame, data_dir: str) -> list:
+    """
+    Saves market data as .npy files, which are memory-mapped by workers
+    :return: list of saved columns
+    """
+    market_data = market_data.select_dtypes(include=[np.number])
+    np.save(os.path.join(data_dir, 'values.npy'),
+            market_data.values.astype(np.float64))
+    np.save(os.path.join(data_dir, 'index.npy'),
+            market_data.index.values.astype('datetime64[ns]').view(np.int64))
+    return list(market_data.columns)
+
+
+def load_market_data(data_dir: str, columns: list) -> pd.DataFrame:
+    """
+    Loads market data saved by dump_market_data as memory-mapped arrays
+    Data pages are shared between all processes by the OS page cache
+    """
+    values = np.load(os.path.join(data_dir, 'values.npy'), mmap_mode='r')
+    index = np.load(os.path.join(data_dir, 'index.npy'), mmap_mode='r')
+    return pd.DataFrame(
+        values, index=pd.DatetimeIndex(index, name='Date'),
+        columns=columns, copy=False)
+
+
+# Optimizer worker process state - set once by _init_worker
+_worker_state = dict()
+
+
+def _init_worker(data_dir: str, columns: list, Backtester,
+                 fee: float, priority: str, cache_max_bytes: int) -> None:
+    """ Loads market data once per worker process """
+    market_data = load_market_data(data_dir, columns)
+    _worker_state['market_data_cache'] = \
+        market_data_preprocessing.MarketDataCache(market_data)
+    _worker_state['indicator_cache'] = technicals.IndicatorCache(cache_max_bytes)
+    _worker_state['Backtester'] = Backtester
+    _worker_state['fee'] = fee
+    _worker_state['priority'] = priority
+
+
+def _evaluate_trial(params: dict) -> float:
+    return calculate_loss(_worker_state['Backtester'], params,
+                          _worker_state['market_data_cache'],
+                          _worker_state['indicator_cache'],
+                          _worker_state['fee'], _worker_state['priority'])
+
 
 class BaseTechnicalOptimizer:
     """
@@ -23,27 +97,37 @@ class BaseTechnicalOptimizer:
     best combintion of technical indicator strategy params
     """
     __slots__ = ('_file_path', '_file_source', '_param_space', '_fee',
-                 '_priority', '_Backtester', '_market_data', '_trained',
-                 '_best_params', '_hyperopt_space', '_trials')
+                 '_priority', '_cache_max_bytes', '_Backtester',
+                 '_market_data', '_market_data_cache', '_indicator_cache',
+                 '_trained', '_best_params', '_hyperopt_space', '_trials',
+                 '_random_state')
 
     def __init__(self, file_path: str, file_source: str,
                  param_space: dict, fee: float,
-                 priority: str = 'return'):
+                 priority: str = 'return', cache_max_bytes: int = 2 ** 30):
+        """
+        :param cache_max_bytes: memory limit of indicators cached between
+        trials (per worker process in parallel mode)
+        """
 
         self._file_path = file_path
         self._file_source = file_source
         self._param_space = param_space
         self._fee = fee
         self._priority = priority
+        self._cache_max_bytes = cache_max_bytes
 
         self._Backtester: technicals.BaseTechnicalsBacktester = None
         self._market_data = pd.DataFrame()
+        self._market_data_cache: market_data_preprocessing.MarketDataCache = None
+        self._indicator_cache: technicals.IndicatorCache = None
         self._trained = False
         self._best_params = dict()
 
         # Hyperopt
         self._hyperopt_space = dict()
         self._trials = hyperopt.Trials()
+        self._random_state = np.random.RandomState()
 
     @property
     def best_params(self) -> dict:
@@ -57,10 +141,15 @@ class BaseTechnicalOptimizer:
         Sets '_market_data' attribute to keep that in memory
         This way while hyper optimization searching, data is not read
         from file every iteration
+        Resampled dataframes are cached, so every interval is resampled once
+        and indicators are calculated once per interval and params
         """
         file_reader = file_readers.FileReaderFactory(
             self._file_path, self._file_source).get_file_reader()
         self._market_data = file_reader.read_data()
+        self._market_data_cache = market_data_preprocessing.MarketDataCache(
+            self._market_data)
+        self._indicator_cache = technicals.IndicatorCache(self._cache_max_bytes)
 
     @abc.abstractmethod
     def _init_hyperopt_space(self) -> None:
@@ -78,14 +167,9 @@ class BaseTechnicalOptimizer:
 
     def _objective_function(self, params: dict) -> float:
         """ Function to minimize using bayesian hyperopt model """
-        params['fee'] = self._fee
-        backtester_model = self._Backtester(**params)
-        backtester_model.fit_from_data(market_data=self._market_data)
-
-        if self._priority == 'return':
-            return 1 - backtester_model.strategy_return
-        elif self._priority == 'drawdown':
-            return backtester_model.maximum_drawdown
+        return calculate_loss(self._Backtester, params,
+                              self._market_data_cache, self._indicator_cache,
+                              self._fee, self._priority)
 
     def _save_best_params(self, best_dict: dict) -> None:
         """
@@ -100,32 +184,119 @@ class BaseTechnicalOptimizer:
             else:
                 self._best_params[k] = self._param_space[k][best_dict[k]]
 
-    def fit(self, n_iterations: int) -> None:
+    @property
+    def backtester_class(self):
+        return self._Backtester
+
+    def fit(self, n_iterations: int, n_jobs: int = 1) -> None:
         """
         Starts Bayesian optimization
         Depends on data size, number of parameters to search, might take
         very long time - run it only in dedicated thread or process when
         MongoDB Trials are not set!
+        :param n_iterations: number of trials to evaluate
+        :param n_jobs: number of worker processes evaluating trials
         """
         self._prepare_data()
+        self._fit(n_iterations, n_jobs)
+
+    def fit_from_cache(
+            self, market_data_cache: market_data_preprocessing.MarketDataCache,
+            n_iterations: int) -> None:
+        """
+        Starts Bayesian optimization in current process on already
+        prepared market data, file is not read
+        """
+        self._market_data_cache = market_data_cache
+        self._indicator_cache = technicals.IndicatorCache(self._cache_max_bytes)
+        self._fit(n_iterations, n_jobs=1)
+
+    def _fit(self, n_iterations: int, n_jobs: int) -> None:
         self._init_hyperopt_space()
-        best_dict = hyperopt.fmin(fn=self._objective_function,
-                                  space=self._hyperopt_space,
-                                  algo=hyperopt.tpe.suggest,
-                                  trials=self._trials,
-                                  max_evals=n_iterations)
+        if n_jobs > 1:
+            best_dict = self._fit_parallel(n_iterations, n_jobs)
+        else:
+            best_dict = hyperopt.fmin(fn=self._objective_function,
+                                      space=self._hyperopt_space,
+                                      algo=hyperopt.tpe.suggest,
+                                      trials=self._trials,
+                                      max_evals=n_iterations)
 
         self._save_best_params(best_dict=best_dict)
         self._trained = True
 
+    def _suggest_trial(self, domain: hyperopt.Domain) -> tuple:
+        """
+        Inserts new TPE suggestion to trials
+        Trials still evaluated by workers are treated as the worst ones
+        :return: (trial id, params dict)
+        """
+        new_ids = self._trials.new_trial_ids(1)
+        self._trials.refresh()
+        new_trials = hyperopt.tpe.suggest(
+            new_ids, domain, self._trials,
+            self._random_state.randint(2 ** 31 - 1))
+        self._trials.insert_trial_docs(new_trials)
+        self._trials.refresh()
+
+        trial = new_trials[0]
+        values = {k: v[0] for k, v in trial['misc']['vals'].items() if v}
+        return trial['tid'], hyperopt.space_eval(self._hyperopt_space, values)
+
+    def _finish_trial(self, tid: int, loss: float) -> None:
+        for trial in self._trials.trials:
+            if trial['tid'] == tid:
+                trial['state'] = hyperopt.JOB_STATE_DONE
+                trial['result'] = {'loss': loss, 'status': hyperopt.STATUS_OK}
+                break
+        self._trials.refresh()
+
+    def _fit_parallel(self, n_iterations: int, n_jobs: int) -> dict:
+        """
+        Evaluates trials asynchronously in a pool of n_jobs processes
+        New trial is suggested as soon as any worker is free
+        """
+        domain = hyperopt.Domain(self._objective_function,
+                                 self._hyperopt_space)
+        finished = queue.Queue()
+        data_dir = tempfile.mkdtemp(prefix='trai_optimizer_')
+        try:
+            columns = dump_market_data(self._market_data, data_dir)
+            init_args = (data_dir, columns, self._Backtester, self._fee,
+                         self._priority, self._cache_max_bytes)
+
+            with multiprocessing.Pool(n_jobs, _init_worker, init_args) as pool:
+                n_submitted = 0
+                n_running = 0
+                while n_submitted < n_iterations or n_running:
+                    while n_running < n_jobs and n_submitted < n_iterations:
+                        tid, params = self._suggest_trial(domain)
+                        pool.apply_async(
+                            _evaluate_trial, (params, ),
+                            callback=lambda loss, tid=tid: finished.put((tid, loss, None)),
+                            error_callback=lambda e, tid=tid: finished.put((tid, None, e)))
+                        n_submitted += 1
+                        n_running += 1
+
+                    tid, loss, error = finished.get()
+                    n_running -= 1
+                    if error is not None:
+                        raise error
+                    self._finish_trial(tid, loss)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        return self._trials.argmin
+
 
 class StochasticOptimizer(BaseTechnicalOptimizer):
     """ Bayesian optimizer for Stochastic Indicator strategy """
     __slots__ = ()
 
     def __init__(self, file_path: str, file_source: str, param_space: dict,
-                 fee: float, priority: str) -> None:
-        super().__init__(file_path, file_source, param_space, fee, priority)
+                 fee: float, priority: str, cache_max_bytes: int = 2 ** 30) -> None:
+        super().__init__(file_path, file_source, param_space, fee, priority,
+                         cache_max_bytes)
         self._Backtester = technicals.StochasticOscilatorBacktester
 
     def _init_hyperopt_space(self) -> None:
@@ -152,44 +323,28 @@ class StochasticOptimizer(BaseTechnicalOptimizer):
             self._param_space['stoch_short_threshold'][1])
 
 
-#
-
-# import objsize
-path = '/Users/kq794tb/Desktop/TRAI_Lite/DAX_bid.csv'
-file_source = 'dukascopy'
-
-my_params = {
-        'enter_interval': ['1T', '5T', '15T'],
-        'exit_interval': ['1T', '5T', '15T'],
-        'start_hour': np.arange(7, 10, dtype=int),
-        'end_hour': np.arange(15, 19, dtype=int),
-        'enter_k_period': np.arange(7, 14, dtype=int),
-        'enter_smooth': np.arange(1, 3, dtype=int),
-        'enter_d_period': np.arange(1, 3, dtype=int),
-        'exit_k_period': np.arange(7, 14, dtype=int),
-        'exit_smooth': np.arange(1, 3, dtype=int),
-        'exit_d_period': np.arange(1, 3, dtype=int),
-        'stoch_long_threshold': [5, 30],
-        'stoch_short_threshold': [70, 90]
-        }
-
-
-optimizer = StochasticOptimizer(
-    file_path=path, file_source=file_source, param_space=my_params,
-    fee=0.0, priority='return')
-
-optimizer.fit(n_iterations=100)
-print(optimizer.best_params)
-#
-# print(objsize.get_deep_size(optimizer))
-# optimizer.fit()
-
-
-
-
-
-
-
-
-
-
+if __name__ == '__main__':
+    path = '/Users/kq794tb/Desktop/TRAI_Lite/DAX_bid.csv'
+    file_source = 'dukascopy'
+
+    my_params = {
+            'enter_interval': ['1T', '5T', '15T'],
+            'exit_interval': ['1T', '5T', '15T'],
+            'start_hour': np.arange(7, 10, dtype=int),
+            'end_hour': np.arange(15, 19, dtype=int),
+            'enter_k_period': np.arange(7, 14, dtype=int),
+            'enter_smooth': np.arange(1, 3, dtype=int),
+            'enter_d_period': np.arange(1, 3, dtype=int),
+            'exit_k_period': np.arange(7, 14, dtype=int),
+            'exit_smooth': np.arange(1, 3, dtype=int),
+            'exit_d_period': np.arange(1, 3, dtype=int),
+            'stoch_long_threshold': [5, 30],
+            'stoch_short_threshold': [70, 90]
+            }
+
+    optimizer = StochasticOptimizer(
+        file_path=path, file_source=file_source, param_space=my_params,
+        fee=0.0, priority='return')
+
+    optimizer.fit(n_iterations=100)
+    print(optimizer.best_params)
@@ -1,4 +1,6 @@
 import abc
+import collections
+import itertools
 import numpy as np
 import pandas as pd
 
@@ -12,16 +14,104 @@ import market_data_preprocessing
 import technical_indicators
 
 
+def forward_fill_positions(enter: np.ndarray, exit: np.ndarray,
+                           position: int) -> np.ndarray:
+    """
+    Array equivalent of setting position on enter, 0 on exit (exit
+    overrides enter), 0 on first row and forward filling
+    Only rows with signals are visited, then positions are repeated
+    until the next signal
+    Works on 1-D arrays and column-wise on 2-D arrays
+    """
+    if enter.ndim == 2:
+        # Columns are laid out one after another, every column
+        # starts with its first row event
+        is_first_row = np.zeros(enter.shape[::-1], dtype=bool)
+        is_first_row[:, 0] = True
+        positions = forward_fill_positions(
+            enter.T.ravel(), exit.T.ravel() | is_first_row.ravel(), position)
+        return positions.reshape(enter.shape[::-1]).T
+
+    is_event = enter | exit
+    is_event[0] = True
+    events = np.flatnonzero(is_event)
+
+    values = np.where(enter[events] & ~exit[events], position, 0).astype(np.int8)
+    values[0] = 0
+    return np.repeat(values, np.diff(np.append(events, len(enter))))
+
+
+def calculate_positions(long_enter: np.ndarray, long_exit: np.ndarray,
+                        short_enter: np.ndarray, short_exit: np.ndarray,
+                        flat: np.ndarray = None) -> np.ndarray:
+    """
+    Calculates position vector from boolean conditions arrays
+    :param flat: optional condition forcing both positions to be closed,
+    for example end of trading hours
+    :return: int8 array of positions: 1 - long, -1 - short, 0 - no position
+    """
+    if flat is not None:
+        long_exit = long_exit | flat
+        short_exit = short_exit | flat
+    return forward_fill_positions(long_enter, long_exit, 1) + \
+        forward_fill_positions(short_enter, short_exit, -1)
+
+
+class IndicatorCache:
+    """
+    Memoizing store of indicator arrays shared between backtests
+    Least recently used arrays are evicted when stored arrays
+    exceed max_bytes
+    """
+    __slots__ = ('_max_bytes', '_n_bytes', '_arrays')
+
+    def __init__(self, max_bytes: int = 2 ** 30):
+        self._max_bytes = max_bytes
+        self._n_bytes = 0
+        self._arrays = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._arrays)
+
+    @property
+    def n_bytes(self) -> int:
+        return self._n_bytes
+
+    def get(self, key: tuple, calculate) -> tuple:
+        """
+        :param key: hashable indicator key, for example
+        ('stochastic', interval, k_period, smooth, d_period)
+        :param calculate: function returning tuple of arrays,
+        called only when key is not cached
+        :return: tuple of read-only arrays
+        """
+        if key in self._arrays:
+            self._arrays.move_to_end(key)
+            return self._arrays[key]
+
+        arrays = tuple(calculate())
+        for array in arrays:
+            array.flags.writeable = False
+
+        self._arrays[key] = arrays
+        self._n_bytes += sum(array.nbytes for array in arrays)
+        while self._n_bytes > self._max_bytes and len(self._arrays) > 1:
+            _, evicted = self._arrays.popitem(last=False)
+            self._n_bytes -= sum(array.nbytes for array in evicted)
+        return arrays
+
+
 class BaseTechnicalsBacktester:
     """ Base class for technical strategies backtesting """
     __slots__ = ('_enter_interval', '_exit_interval', '_start_hour',
-                 '_end_hour', '_fee', '_data', '_exit_df',
+                 '_end_hour', '_fee', '_close_at_end_hour', '_data', '_exit_df', '_market_data_cache',
+                 '_indicator_cache',
                  '_long_enter_condition', '_long_exit_condition',
                  '_short_enter_condition', '_short_exit_condition',
                  '_is_strategy_applied', '_ratios_calculator')
 
     def __init__(self, enter_interval: str, exit_interval: str, start_hour: int,
-                 end_hour: int, fee: float):
+                 end_hour: int, fee: float, close_at_end_hour: bool = False):
         """
         :param enter_interval:
          interval for calculating position enter '%D', '%H', '%T'
@@ -30,15 +120,20 @@ class BaseTechnicalsBacktester:
         :param start_hour: trading start hour
         :param end_hour: trading end hour
         :param fee: trading fee (spread)
+        :param close_at_end_hour: force closing positions from end hour,
+        as live strategies do
         """
         self._enter_interval = enter_interval
         self._exit_interval = exit_interval
         self._start_hour = start_hour
         self._end_hour = end_hour
         self._fee = fee
+        self._close_at_end_hour = close_at_end_hour
 
         self._data = pd.DataFrame()
         self._exit_df = pd.DataFrame()
+        self._market_data_cache: market_data_preprocessing.MarketDataCache = None
+        self._indicator_cache: IndicatorCache = None
 
         self._long_enter_condition = pd.Series()
         self._long_exit_condition = pd.Series()
@@ -72,30 +167,22 @@ class BaseTechnicalsBacktester:
                 'No purpose for returning dataframe, '
                 'with no strategy applied!')
 
-    def _apply_long_positions(self) -> None:
-        """ Applies Long positions logic to dataframe """
-        self._set_long_positions_logic()
-        self._data['Long'] = np.nan
-        self._data.loc[self._long_enter_condition, 'Long'] = 1
-        self._data.loc[self._long_exit_condition, 'Long'] = 0
-
-    def _apply_short_positions(self) -> None:
-        """ Applies Short positions logic to dataframe """
-        self._set_short_positions_logic()
-        self._data['Short'] = np.nan
-        self._data.loc[self._short_enter_condition, 'Short'] = -1
-        self._data.loc[self._short_exit_condition, 'Short'] = 0
-
     def _apply_strategy_positions(self) -> None:
+        """ Applies Long and Short positions logic to dataframe """
         self._calculate_indicators()
-        self._apply_long_positions()
-        self._apply_short_positions()
+        self._set_long_positions_logic()
+        self._set_short_positions_logic()
 
-        for position in ['Long', 'Short']:
-            self._data.iloc[0, self._data.columns.get_loc(position)] = 0
-            self._data[position] = self._data[position].fillna(method='ffill')
+        flat_condition = None
+        if self._close_at_end_hour:
+            flat_condition = self._data['Hour'].values >= self._end_hour
 
-        self._data['Position'] = self._data['Long'] + self._data['Short']
+        self._data['Position'] = calculate_positions(
+            long_enter=self._long_enter_condition.values,
+            long_exit=self._long_exit_condition.values,
+            short_enter=self._short_enter_condition.values,
+            short_exit=self._short_exit_condition.values,
+            flat=flat_condition)
         self._is_strategy_applied = True
 
     def _fit(self):
@@ -105,20 +192,34 @@ class BaseTechnicalsBacktester:
             data=self._data, fee=self._fee)
         self._ratios_calculator.fit()
 
-    def fit_from_data(self, market_data: pd.DataFrame) -> None:
+    def fit_from_cache(
+            self, market_data_cache: market_data_preprocessing.MarketDataCache,
+            indicator_cache: IndicatorCache = None) -> None:
         """
-        Runs initialized backtester using received data
-        :param market_data : prepared market data DataFrame contains price
-        columns, datetime index, 'Hour' column
+        Runs initialized backtester using already resampled data
+        :param market_data_cache : cache of market data prepared
+        for every interval, shared between backtests
+        :param indicator_cache : cache of indicators calculated on
+        market_data_cache, shared between backtests
         """
-        self._data = market_data_preprocessing.prepare_market_df(
-            market_data=market_data, interval=self._enter_interval)
-
-        self._exit_df = market_data_preprocessing.prepare_market_df(
-            market_data=market_data, interval=self._exit_interval)
+        self._market_data_cache = market_data_cache
+        self._indicator_cache = indicator_cache
+        if indicator_cache is None:
+            self._indicator_cache = IndicatorCache()
+        self._data = market_data_cache.get_market_df(self._enter_interval)
+        self._exit_df = market_data_cache.get_market_df(self._exit_interval)
 
         self._fit()
 
+    def fit_from_data(self, market_data: pd.DataFrame) -> None:
+        """
+        Runs initialized backtester using received data
+        :param market_data : market data DataFrame contains price
+        columns, datetime index
+        """
+        self.fit_from_cache(
+            market_data_preprocessing.MarketDataCache(market_data))
+
     def fit_from_file(self, file_path: str, file_source: str) -> None:
         """
         Creates csv loader object based on received csv source, loads data
@@ -132,6 +233,13 @@ class BaseTechnicalsBacktester:
         market_data = file_reader.read_data()
         self.fit_from_data(market_data=market_data)
 
+    @property
+    def returns(self) -> pd.Series:
+        """
+        :return: strategy percentage change of every bar
+        """
+        return self._data['Strategy']
+
     @property
     def market_return(self):
         return self._ratios_calculator.calculate_market_return()
@@ -164,9 +272,10 @@ class StochasticOscilatorBacktester(BaseTechnicalsBacktester):
                  enter_smooth: int, enter_d_period: int, exit_k_period: int,
                  exit_smooth: int, exit_d_period: int,
                  stoch_long_threshold=20.0,
-                 stoch_short_threshold=80.0):
+                 stoch_short_threshold=80.0,
+                 close_at_end_hour: bool = False):
         super().__init__(enter_interval, exit_interval,
-                         start_hour, end_hour, fee)
+                         start_hour, end_hour, fee, close_at_end_hour)
 
         # Enter signals stochastic parameters
         self._enter_k_period = enter_k_period
@@ -181,27 +290,44 @@ class StochasticOscilatorBacktester(BaseTechnicalsBacktester):
         self._exit_smooth = exit_smooth
         self._exit_d_period = exit_d_period
 
+    def _get_stochastic(self, df: pd.DataFrame, interval: str,
+                        k_period: int, smooth: int, d_period: int) -> tuple:
+        """
+        :return: cached (K, D) arrays calculated on interval df, aligned
+        to enter interval datetime index
+        """
+        def calculate():
+            k_line, d_line = \
+                technical_indicators.StochasticOscillator.calculate_full_stochastic(
+                    df=df, k_period=k_period, smooth=smooth, d_period=d_period)
+            # If strategy is asymetric, fix the datetime index
+            if interval != self._enter_interval:
+                return tuple(
+                    self._market_data_cache.align_to_enter_interval(
+                        line.values, self._enter_interval, interval)
+                    for line in (k_line, d_line))
+            return k_line.values, d_line.values
+
+        key = ('stochastic', interval, self._enter_interval,
+               k_period, smooth, d_period)
+        return self._indicator_cache.get(key, calculate)
+
     def _calculate_indicators(self):
         """ Applies stochastic oscilator to historical data """
-        technical_indicators.StochasticOscillator.apply_full_stochastic_to_df(
+        self._data['K'], self._data['D'] = self._get_stochastic(
             df=self._data,
+            interval=self._enter_interval,
             k_period=self._enter_k_period,
             smooth=self._enter_smooth,
             d_period=self._enter_d_period)
 
-        technical_indicators.StochasticOscillator.apply_full_stochastic_to_df(
+        self._data['K_exit'], self._data['D_exit'] = self._get_stochastic(
             df=self._exit_df,
+            interval=self._exit_interval,
             k_period=self._exit_k_period,
             smooth=self._exit_smooth,
             d_period=self._exit_d_period)
 
-        # If strategy is asymetric, fix the datetime index
-        if self._enter_interval != self._exit_interval:
-            self._exit_df = self._exit_df.reindex(self._data.index).bfill()
-
-        self._data['K_exit'] = self._exit_df['K']
-        self._data['D_exit'] = self._exit_df['D']
-
         del self._exit_df
 
     def _set_long_positions_logic(self):
@@ -235,20 +361,209 @@ class StochasticOscilatorBacktester(BaseTechnicalsBacktester):
                                      (self._data['K_exit'].shift(1) < self._data['D_exit'].shift(1))
 
 
-# import objsize
+class StochasticGridBacktester:
+    """
+    Batch backtesting of Stochastic Oscilator strategy over a grid
+    of parameters - every configuration is one column of 2-D NumPy arrays
+    Positions logic is the same as in StochasticOscilatorBacktester
+    Enter and exit K/D are calculated once per unique indicator params
+    """
+    __slots__ = ('_param_grid', '_chunk_size', '_results')
 
+    grid_keys = ('enter_interval', 'exit_interval', 'start_hour', 'end_hour',
+                 'enter_k_period', 'enter_smooth', 'enter_d_period',
+                 'exit_k_period', 'exit_smooth', 'exit_d_period',
+                 'stoch_long_threshold', 'stoch_short_threshold')
 
-path = '/Users/kq794tb/Desktop/TRAI_Lite/EURUSD_bid.csv'
-strategy = StochasticOscilatorBacktester(
-    enter_interval='1T', exit_interval='5T', start_hour=8, end_hour=16,
-    fee=0.00015, enter_k_period=14, enter_smooth=3, enter_d_period=3,
-    exit_k_period=14, exit_smooth=3, exit_d_period=3, stoch_long_threshold=20,
-    stoch_short_threshold=80)
+    def __init__(self, param_grid: dict, chunk_size: int = 32):
+        """
+        :param param_grid: dict of lists of values to search, keys
+        are the same as StochasticOscilatorBacktester params
+        :param chunk_size: number of configurations processed together,
+        memory usage is about n_bars * chunk_size * 8 bytes per array
+        """
+        self._param_grid = param_grid
+        self._chunk_size = chunk_size
+        self._results = pd.DataFrame()
 
-strategy.fit_from_file(path, 'dukascopy')
-print(strategy.strategy_return)
+    @property
+    def results(self) -> pd.DataFrame:
+        """
+        :return: pandas DataFrame with configurations sorted by
+        return / drawdown ratio, configurations without drawdown
+        are ranked after them by return
+        """
+        if self._results.empty:
+            raise ValueError('No results - use fit method first')
+        return self._results
+
+    def _get_configurations(self, enter_interval: str,
+                            exit_interval: str) -> list:
+        """ Cartesian product of grid params for intervals pair """
+        values = [[enter_interval], [exit_interval]]
+        values.extend(self._param_grid[k] for k in self.grid_keys[2:])
+        return list(itertools.product(*values))
+
+    @staticmethod
+    def _calculate_stochastics(df: pd.DataFrame, params: set) -> dict:
+        """ Calculates K and D arrays for every (k, smooth, d) params """
+        stochastics = dict()
+        for k_period, smooth, d_period in params:
+            k_line, d_line = \
+                technical_indicators.StochasticOscillator.calculate_full_stochastic(
+                    df=df, k_period=k_period, smooth=smooth, d_period=d_period)
+            stochastics[(k_period, smooth, d_period)] = (k_line, d_line)
+        return stochastics
+
+    @staticmethod
+    def _crossings(k_line: np.ndarray, d_line: np.ndarray) -> tuple:
+        """
+        :return: (K > D, K crossed D upwards, K < D, K crossed D downwards)
+        comparisons with NaN are False, same as in pandas
+        """
+        with np.errstate(invalid='ignore'):
+            above = k_line > d_line
+            below = k_line < d_line
+        cross_up = np.zeros_like(above)
+        cross_down = np.zeros_like(below)
+        cross_up[1:] = above[1:] & below[:-1]
+        cross_down[1:] = below[1:] & above[:-1]
+        return above, cross_up, below, cross_down
+
+    def _backtest_intervals(
+            self, market_data_cache: market_data_preprocessing.MarketDataCache,
+            enter_interval: str, exit_interval: str) -> pd.DataFrame:
+        configurations = self._get_configurations(enter_interval, exit_interval)
+        params = pd.DataFrame(configurations, columns=self.grid_keys)
+
+        data = market_data_cache.get_market_df(enter_interval)
+        exit_df = market_data_cache.get_market_df(exit_interval)
+
+        enter_keys = list(zip(params['enter_k_period'], params['enter_smooth'],
+                              params['enter_d_period']))
+        exit_keys = list(zip(params['exit_k_period'], params['exit_smooth'],
+                             params['exit_d_period']))
+        enter_stochastics = self._calculate_stochastics(data, set(enter_keys))
+        exit_stochastics = self._calculate_stochastics(exit_df, set(exit_keys))
+
+        # Unique indicator signals as columns, configurations index them
+        enter_index = {key: i for i, key in enumerate(enter_stochastics)}
+        exit_index = {key: i for i, key in enumerate(exit_stochastics)}
+
+        enter_k = np.column_stack(
+            [k.values for k, _ in enter_stochastics.values()])
+        _, enter_cross_up, _, enter_cross_down = self._crossings(
+            enter_k, np.column_stack(
+                [d.values for _, d in enter_stochastics.values()]))
+
+        exit_lines = list()
+        for k_line, d_line in exit_stochastics.values():
+            k_line, d_line = k_line.values, d_line.values
+            # If strategy is asymetric, fix the datetime index
+            if enter_interval != exit_interval:
+                k_line = market_data_cache.align_to_enter_interval(
+                    k_line, enter_interval, exit_interval)
+                d_line = market_data_cache.align_to_enter_interval(
+                    d_line, enter_interval, exit_interval)
+            exit_lines.append((k_line, d_line))
+        exit_up, exit_cross_up, exit_down, exit_cross_down = self._crossings(
+            np.column_stack([k for k, _ in exit_lines]),
+            np.column_stack([d for _, d in exit_lines]))
+
+        hours = data['Hour'].values[:, None]
+        close = data['Close'].values
+        market = np.zeros_like(close, dtype=np.float64)
+        market[1:] = close[1:] / close[:-1] - 1
+
+        enter_columns = np.array([enter_index[k] for k in enter_keys])
+        exit_columns = np.array([exit_index[k] for k in exit_keys])
+        start_hours = params['start_hour'].values
+        end_hours = params['end_hour'].values
+        long_thresholds = params['stoch_long_threshold'].values
+        short_thresholds = params['stoch_short_threshold'].values
+
+        returns = np.empty(len(params))
+        drawdowns = np.empty(len(params))
+        transactions = np.empty(len(params), dtype=np.int64)
+
+        for start in range(0, len(params), self._chunk_size):
+            chunk = slice(start, start + self._chunk_size)
+            e_cols = enter_columns[chunk]
+            x_cols = exit_columns[chunk]
+
+            in_hours = (hours >= start_hours[chunk]) & \
+                       (hours <= end_hours[chunk])
+            k_values = enter_k[:, e_cols]
+            with np.errstate(invalid='ignore'):
+                below_long = k_values < long_thresholds[chunk]
+                above_short = k_values > short_thresholds[chunk]
+            del k_values
+
+            long_enter = enter_cross_up[:, e_cols] & below_long & \
+                exit_up[:, x_cols] & in_hours
+            short_enter = enter_cross_down[:, e_cols] & above_short & \
+                exit_down[:, x_cols] & in_hours
+
+            # Long exits on exit K crossing down, short exits on crossing up
+            position = calculate_positions(
+                long_enter, exit_cross_down[:, x_cols],
+                short_enter, exit_cross_up[:, x_cols])
+
+            strategy = market[1:, None] * position[:-1]
+            equity = np.cumsum(strategy, axis=0) + 1
+            returns[chunk] = equity[-1] - 1
+            drawdowns[chunk] = np.max(
+                np.maximum.accumulate(equity, axis=0) - equity, axis=0)
+            transactions[chunk] = np.count_nonzero(
+                (position[1:] != position[:-1]) & (position[:-1] == 0), axis=0)
+
+        params['Return'] = returns
+        params['Maximum drawdown'] = drawdowns
+        # Ratio of configurations without drawdown is undefined (NaN),
+        # not inf - a single small winning trade must not rank first
+        ratios = np.full(len(params), np.nan)
+        np.divide(returns, drawdowns, out=ratios, where=drawdowns > 0)
+        params['Return/Drawdown'] = ratios
+        params['Transactions'] = transactions
+        return params
 
+    def fit_from_data(self, market_data: pd.DataFrame) -> None:
+        """
+        Backtests all grid configurations using received data
+        :param market_data : market data DataFrame contains price
+        columns, datetime index
+        """
+        market_data_cache = market_data_preprocessing.MarketDataCache(market_data)
+        results = [
+            self._backtest_intervals(market_data_cache, enter_interval, exit_interval)
+            for enter_interval in self._param_grid['enter_interval']
+            for exit_interval in self._param_grid['exit_interval']]
 
+        self._results = pd.concat(results, ignore_index=True).sort_values(
+            by=['Return/Drawdown', 'Return'], ascending=False,
+            na_position='last').reset_index(drop=True)
+
+    def fit_from_file(self, file_path: str, file_source: str) -> None:
+        """
+        Creates csv loader object based on received csv source, loads data
+        and fits the backtester
+        :param file_path: full path to file like '/home/user/dir/EURUSD.csv'
+        :param file_source: for example 'dukascopy'
+        """
+        file_reader = file_readers.FileReaderFactory(
+            file_path, file_source).get_file_reader()
+
+        market_data = file_reader.read_data()
+        self.fit_from_data(market_data=market_data)
 
 
+if __name__ == '__main__':
+    path = '/Users/kq794tb/Desktop/TRAI_Lite/EURUSD_bid.csv'
+    strategy = StochasticOscilatorBacktester(
+        enter_interval='1T', exit_interval='5T', start_hour=8, end_hour=16,
+        fee=0.00015, enter_k_period=14, enter_smooth=3, enter_d_period=3,
+        exit_k_period=14, exit_smooth=3, exit_d_period=3, stoch_long_threshold=20,
+        stoch_short_threshold=80)
 
+    strategy.fit_from_file(path, 'dukascopy')
+    print(strategy.strategy_return)
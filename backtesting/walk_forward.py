@@ -0,0 +1,202 @@
+import multiprocessing
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import file_readers
+import optimizers
+
+import sys
+sys.path.insert(0, '../data_preprocessing')
+import market_data_preprocessing
+
+
+# Walk forward worker process state - set once by _init_worker
+_worker_state = dict()
+
+
+def _init_worker(data_dir: str, columns: list, intervals: list) -> None:
+    """
+    Loads market data once per worker process and resamples it
+    to every searched interval - folds slice resampled dataframes
+    """
+    market_data = optimizers.load_market_data(data_dir, columns)
+    market_data_cache = market_data_preprocessing.MarketDataCache(market_data)
+    for interval in intervals:
+        market_data_cache.get_market_df(interval)
+    _worker_state['market_data_cache'] = market_data_cache
+    _worker_state['intervals'] = intervals
+
+
+def run_fold(market_data_cache: market_data_preprocessing.MarketDataCache,
+             intervals: list, Optimizer, param_space: dict, fee: float,
+             priority: str, n_iterations: int, fold: tuple) -> tuple:
+    """
+    Optimizes params on fold train window and backtests them
+    on fold test window
+    :param fold: (train_start, test_start, test_end) timestamps
+    :return: (best params, test window returns, test return,
+    test maximum drawdown)
+    """
+    train_start, test_start, test_end = fold
+    optimizer = Optimizer(None, None, param_space, fee, priority)
+    optimizer.fit_from_cache(
+        market_data_cache.slice(train_start, test_start, intervals),
+        n_iterations=n_iterations)
+
+    backtester_model = optimizer.backtester_class(
+        fee=fee, **optimizer.best_params)
+    backtester_model.fit_from_cache(
+        market_data_cache.slice(test_start, test_end, intervals))
+
+    return (optimizer.best_params, backtester_model.returns,
+            backtester_model.strategy_return,
+            backtester_model.maximum_drawdown)
+
+
+def _run_fold(args: tuple) -> tuple:
+    return run_fold(_worker_state['market_data_cache'],
+                    _worker_state['intervals'], *args)
+
+
+class WalkForwardBacktester:
+    """
+    Walk forward analysis - strategy params are optimized on rolling
+    train windows and backtested on the following test windows
+    Out of sample test windows are stitched into one equity
+    """
+    __slots__ = ('_Optimizer', '_param_space', '_fee', '_priority',
+                 '_n_folds', '_train_ratio', '_n_iterations', '_n_jobs',
+                 '_results', '_returns')
+
+    def __init__(self, Optimizer, param_space: dict, fee: float,
+                 n_folds: int, n_iterations: int, train_ratio: float = 3.0,
+                 priority: str = 'return', n_jobs: int = 1):
+        """
+        :param Optimizer: optimizer class, for example StochasticOptimizer
+        :param param_space: optimizer param space
+        :param n_folds: number of train / test windows
+        :param n_iterations: optimizer iterations for every fold
+        :param train_ratio: train window length as a multiple
+        of test window length
+        :param n_jobs: number of worker processes running folds
+        """
+        self._Optimizer = Optimizer
+        self._param_space = param_space
+        self._fee = fee
+        self._priority = priority
+        self._n_folds = n_folds
+        self._train_ratio = train_ratio
+        self._n_iterations = n_iterations
+        self._n_jobs = n_jobs
+
+        self._results = pd.DataFrame()
+        self._returns = pd.Series()
+
+    @property
+    def results(self) -> pd.DataFrame:
+        """
+        :return: pandas DataFrame with fold windows, best params and
+        out of sample return and drawdown
+        """
+        if self._results.empty:
+            raise ValueError('No results - use fit method first')
+        return self._results
+
+    @property
+    def equity(self) -> pd.Series:
+        """
+        :return: stitched out of sample cumulative return
+        """
+        return self._returns.cumsum() + 1
+
+    @property
+    def strategy_return(self) -> float:
+        return self._returns.sum()
+
+    @property
+    def maximum_drawdown(self) -> float:
+        equity = self.equity.dropna()
+        return (np.maximum.accumulate(equity) - equity).max()
+
+    def _get_folds(self, market_data: pd.DataFrame) -> list:
+        """
+        :return: list of (train_start, test_start, test_end) tuples
+        """
+        start = market_data.index[0]
+        end = market_data.index[-1] + pd.Timedelta(minutes=1)
+        test_length = (end - start) / (self._train_ratio + self._n_folds)
+        train_length = test_length * self._train_ratio
+
+        folds = list()
+        for i in range(self._n_folds):
+            train_start = (start + test_length * i).floor('1T')
+            test_start = (start + test_length * i + train_length).floor('1T')
+            test_end = end if i == self._n_folds - 1 else \
+                (start + test_length * (i + 1) + train_length).floor('1T')
+            folds.append((train_start, test_start, test_end))
+        return folds
+
+    def _get_intervals(self) -> list:
+        return sorted(set(self._param_space['enter_interval']) |
+                      set(self._param_space['exit_interval']) | {'1T'})
+
+    def _run_folds(self, market_data: pd.DataFrame, folds: list) -> list:
+        intervals = self._get_intervals()
+        fold_args = [(self._Optimizer, self._param_space, self._fee,
+                      self._priority, self._n_iterations, fold)
+                     for fold in folds]
+
+        if self._n_jobs <= 1:
+            market_data_cache = market_data_preprocessing.MarketDataCache(
+                market_data)
+            return [run_fold(market_data_cache, intervals, *args)
+                    for args in fold_args]
+
+        data_dir = tempfile.mkdtemp(prefix='trai_walk_forward_')
+        try:
+            columns = optimizers.dump_market_data(market_data, data_dir)
+            with multiprocessing.Pool(min(self._n_jobs, len(folds)),
+                                      _init_worker,
+                                      (data_dir, columns, intervals)) as pool:
+                return pool.map(_run_fold, fold_args, chunksize=1)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    def fit_from_data(self, market_data: pd.DataFrame) -> None:
+        """
+        Runs walk forward analysis using received data
+        :param market_data : market data DataFrame contains price
+        columns, datetime index
+        """
+        folds = self._get_folds(market_data)
+        fold_results = self._run_folds(market_data, folds)
+
+        results = list()
+        returns = list()
+        for (train_start, test_start, test_end), fold_result in zip(
+                folds, fold_results):
+            best_params, test_returns, test_return, test_drawdown = fold_result
+            results.append(dict(best_params, train_start=train_start,
+                                test_start=test_start, test_end=test_end,
+                                test_return=test_return,
+                                test_drawdown=test_drawdown))
+            returns.append(test_returns)
+
+        self._results = pd.DataFrame(results)
+        self._returns = pd.concat(returns)
+
+    def fit_from_file(self, file_path: str, file_source: str) -> None:
+        """
+        Creates file loader object based on received source, loads data
+        and runs walk forward analysis
+        :param file_path: full path to file like '/home/user/dir/EURUSD.csv'
+        :param file_source: for example 'dukascopy'
+        """
+        file_reader = file_readers.FileReaderFactory(
+            file_path, file_source).get_file_reader()
+
+        market_data = file_reader.read_data()
+        self.fit_from_data(market_data=market_data)
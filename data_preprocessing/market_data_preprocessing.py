@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 
@@ -37,3 +38,138 @@ def prepare_market_df(market_data: pd.DataFrame,
         return resample_dataframe(df=market_data, interval=interval)
     else:
         return market_data
+
+
+def aggregate_ohlc(df: pd.DataFrame, interval: str,
+                   price_column: str = None) -> pd.DataFrame:
+    """
+    Aggregates prices to OHLC bars - first, max, min and last price
+    :param df: pandas DataFrame with DateTime index and OHLC columns,
+    or ticks DataFrame with price_column
+    :param interval: for example '1T', '5T', '1H'
+    :param price_column: tick price column, for example 'Bid'
+    :return: bars DataFrame without empty intervals
+    """
+    if not isinstance(df.index, pd.DatetimeIndex):
+        raise TypeError('Cannot aggregate non-datetime index dataframe!')
+
+    if price_column is not None:
+        bars = df[price_column].resample(interval).ohlc()
+        bars.columns = ['Open', 'High', 'Low', 'Close']
+    else:
+        aggregations = {'Open': 'first', 'High': 'max',
+                        'Low': 'min', 'Close': 'last'}
+        if 'Volume' in df.columns:
+            aggregations['Volume'] = 'sum'
+        bars = df.resample(interval).agg(aggregations)
+    return bars.dropna(subset=['Close'])
+
+
+def resample_chunks_to_ohlc(chunks, interval: str,
+                            price_column: str = None):
+    """
+    Builds OHLC bars from time ordered chunks of prices with constant
+    memory - the last, possibly unfinished bar of every chunk is carried
+    to the next chunk
+    :param chunks: iterable of pandas DataFrames with DateTime index
+    :param interval: for example '1T', '5T', '1H'
+    :param price_column: tick price column, for example 'Bid'
+    :return: generator of bars DataFrames
+    """
+    carried = None
+    for chunk in chunks:
+        if carried is not None:
+            chunk = pd.concat([carried, chunk])
+        if chunk.empty:
+            continue
+
+        last_bar_start = chunk.index[-1].floor(interval)
+        is_complete = chunk.index < last_bar_start
+        carried = chunk[~is_complete]
+        if is_complete.any():
+            yield aggregate_ohlc(chunk[is_complete], interval, price_column)
+
+    if carried is not None and not carried.empty:
+        yield aggregate_ohlc(carried, interval, price_column)
+
+
+class MarketDataCache:
+    """
+    Keeps prepared market dataframes for every requested interval,
+    so the same history is resampled only once
+    Handed out dataframes are shallow copies - new columns can be added,
+    but cached columns must not be modified in place
+    """
+    __slots__ = ('_market_data', '_market_dfs', '_exit_indexers')
+
+    def __init__(self, market_data: pd.DataFrame):
+        """
+        :param market_data: pandas DataFrame with datetime index
+        """
+        self._market_data = market_data.copy(deep=False)
+        add_hour_column(self._market_data)
+        self._market_dfs = {'1T': self._market_data}
+        self._exit_indexers = dict()
+
+    def _get_cached_df(self, interval: str) -> pd.DataFrame:
+        if interval not in self._market_dfs:
+            self._market_dfs[interval] = resample_dataframe(
+                df=self._market_data, interval=interval)
+        return self._market_dfs[interval]
+
+    def get_market_df(self, interval: str) -> pd.DataFrame:
+        """
+        :param interval: for example '1T', '5T', '1H'
+        :return: prepared pandas DataFrame, same as prepare_market_df
+        """
+        return self._get_cached_df(interval).copy(deep=False)
+
+    def slice(self, start: pd.Timestamp, end: pd.Timestamp,
+              intervals) -> 'MarketDataCache':
+        """
+        Cache of market data from start (inclusive) to end (exclusive)
+        Dataframes of received intervals are sliced from already resampled
+        ones instead of resampling again
+        :param intervals: iterable of intervals, for example ['1T', '5T']
+        """
+        market_data_cache = MarketDataCache(
+            self._market_data.loc[(self._market_data.index >= start) &
+                                  (self._market_data.index < end)])
+        for interval in intervals:
+            df = self._get_cached_df(interval)
+            market_data_cache._market_dfs[interval] = \
+                df.loc[(df.index >= start) & (df.index < end)]
+        return market_data_cache
+
+    def _get_exit_indexer(self, enter_interval: str,
+                          exit_interval: str) -> np.ndarray:
+        """
+        Positions of exit interval rows for every enter interval row,
+        -1 where enter datetime is not present in exit interval index
+        """
+        key = (enter_interval, exit_interval)
+        if key not in self._exit_indexers:
+            enter_index = self._get_cached_df(enter_interval).index
+            exit_index = self._get_cached_df(exit_interval).index
+            self._exit_indexers[key] = exit_index.get_indexer(enter_index)
+        return self._exit_indexers[key]
+
+    def align_to_enter_interval(self, values: np.ndarray, enter_interval: str,
+                                exit_interval: str) -> np.ndarray:
+        """
+        Aligns exit interval values to enter interval datetime index,
+        equal to exit_df.reindex(enter_df.index).bfill()
+        :param values: array of values calculated on exit interval df
+        :return: array with length of enter interval df
+        """
+        indexer = self._get_exit_indexer(enter_interval, exit_interval)
+        aligned = values[indexer].astype(np.float64)
+        aligned[indexer < 0] = np.nan
+
+        # Backward fill of missing values
+        n_rows = len(aligned)
+        next_valid = np.where(np.isnan(aligned), n_rows, np.arange(n_rows))
+        next_valid = np.minimum.accumulate(next_valid[::-1])[::-1]
+        has_valid = next_valid < n_rows
+        aligned[has_valid] = aligned[next_valid[has_valid]]
+        return aligned
@@ -0,0 +1,73 @@
+import datetime as dt
+
+from databases.ohlc import OHLC
+
+interval_minutes = {
+    '1T': 1,
+    '5T': 5,
+    '15T': 15,
+    '30T': 30,
+    '1H': 60,
+    '1D': 24 * 60
+}
+
+
+def get_bar_start(timestamp: dt.datetime, interval: str) -> dt.datetime:
+    """ Floors timestamp to interval, the same as pandas resample labels """
+    n_minutes = interval_minutes[interval]
+    minute_of_day = timestamp.hour * 60 + timestamp.minute
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0) + \
+        dt.timedelta(minutes=minute_of_day - minute_of_day % n_minutes)
+
+
+class BarAggregator:
+    """
+    Builds higher timeframe OHLC bars from 1 minute OHLC as they arrive
+    Bar is completed with the last minute of its interval, or when the
+    next minute belongs to another interval (gap in 1 minute bars)
+    """
+    __slots__ = ('_intervals', '_bars')
+
+    def __init__(self, intervals: tuple):
+        self._intervals = tuple(intervals)
+        # (asset, interval) -> unfinished bar
+        self._bars = dict()
+
+    @property
+    def intervals(self) -> tuple:
+        return self._intervals
+
+    def get_current_bar(self, asset: str, interval: str) -> OHLC:
+        """ Returns unfinished bar of interval or None """
+        return self._bars.get((asset, interval))
+
+    def add_ohlc(self, ohlc: OHLC, asset: str) -> list:
+        """
+        Updates bars of every interval with 1 minute OHLC
+        Returns list of (interval, OHLC) of bars completed by it
+        """
+        timestamp = ohlc.timestamp
+        if isinstance(timestamp, str):
+            timestamp = dt.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+
+        completed = list()
+        for interval in self._intervals:
+            key = (asset, interval)
+            bar_start = get_bar_start(timestamp, interval)
+            bar = self._bars.get(key)
+            if bar is not None and bar.timestamp != bar_start:
+                completed.append((interval, self._bars.pop(key)))
+                bar = None
+
+            if bar is None:
+                bar = OHLC(bar_start, ohlc.open, ohlc.high, ohlc.low, ohlc.close)
+                self._bars[key] = bar
+            else:
+                bar.high = max(bar.high, ohlc.high)
+                bar.low = min(bar.low, ohlc.low)
+                bar.close = ohlc.close
+
+            if timestamp + dt.timedelta(minutes=1) >= \
+                    bar_start + dt.timedelta(minutes=interval_minutes[interval]):
+                completed.append((interval, self._bars.pop(key)))
+        return completed
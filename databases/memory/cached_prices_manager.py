@@ -0,0 +1,141 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from databases.ohlc import OHLC
+from databases.prices_manager import PricesManager
+
+
+class OHLCRingBuffer:
+    """
+    Fixed capacity buffer of last 1 minute bars of single asset
+    Every bar is written twice (at i and i + capacity), so last n bars
+    are always one contiguous slice of arrays - no copying on reads
+    """
+    __slots__ = ('_capacity', '_timestamps', '_prices', '_position', '_size')
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._timestamps = np.zeros(2 * capacity, dtype='datetime64[ns]')
+        self._prices = np.zeros((2 * capacity, 4), dtype=np.float64)
+        self._position = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_timestamp(self) -> np.datetime64:
+        if not self._size:
+            return None
+        return self._timestamps[self._position + self._capacity - 1]
+
+    def clear(self) -> None:
+        self._position = 0
+        self._size = 0
+
+    def append(self, timestamp: np.datetime64, open: float, high: float,
+               low: float, close: float) -> None:
+        for index in (self._position, self._position + self._capacity):
+            self._timestamps[index] = timestamp
+            self._prices[index] = (open, high, low, close)
+
+        self._position = (self._position + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def extend(self, timestamps: np.ndarray, prices: np.ndarray) -> None:
+        """ Appends bars given as timestamps and (n, 4) OHLC arrays """
+        for timestamp, row in zip(timestamps[-self._capacity:],
+                                  prices[-self._capacity:]):
+            self.append(timestamp, *row)
+
+    def last(self, n: int) -> tuple:
+        """ Returns views of n last (timestamps, OHLC prices) """
+        n = min(n, self._size)
+        end = self._position + self._capacity
+        return self._timestamps[end - n:end], self._prices[end - n:end]
+
+
+class CachedPricesManager(PricesManager):
+    """
+    Write-through cache in front of another prices manager
+    Keeps last bars of every asset in process memory (OHLCRingBuffer),
+    so get_n_last_ohlc does not hit the database every minute.
+    Underlying manager is read only on cold start of asset, after a gap
+    between inserted bars or when more bars than capacity are requested
+    """
+    columns = ('Open', 'High', 'Low', 'Close')
+    __slots__ = ('_prices_manager', '_capacity', '_buffers', '_is_synced')
+
+    def __init__(self, prices_manager: PricesManager, capacity: int = 1000):
+        """
+        :param prices_manager: manager which persists and serves the bars
+        :param capacity: number of last bars kept for every asset
+        """
+        self._prices_manager = prices_manager
+        self._capacity = capacity
+        self._buffers = dict()
+        self._is_synced = dict()
+
+    def warm_up(self, assets: list) -> None:
+        """ Loads last bars of given assets, meant to be called at startup """
+        for asset in assets:
+            self._sync(asset)
+
+    def _sync(self, asset: str) -> None:
+        if asset not in self._buffers:
+            self._buffers[asset] = OHLCRingBuffer(self._capacity)
+
+        buffer = self._buffers[asset]
+        buffer.clear()
+        try:
+            market_data = self._prices_manager.get_n_last_ohlc(self._capacity, asset)
+        except ValueError:
+            # Asset does not have any records yet
+            pass
+        else:
+            buffer.extend(market_data.index.values.astype('datetime64[ns]'),
+                          market_data[list(self.columns)].values)
+        self._is_synced[asset] = True
+
+    def insert_ohlc(self, ohlc: OHLC, asset: str):
+        self._prices_manager.insert_ohlc(ohlc, asset)
+        if not self._is_synced.get(asset):
+            return
+
+        timestamp = ohlc.timestamp
+        if isinstance(timestamp, str):
+            timestamp = dt.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+        timestamp = np.datetime64(timestamp, 'ns')
+
+        buffer = self._buffers[asset]
+        last_timestamp = buffer.last_timestamp
+        if last_timestamp is None or timestamp - last_timestamp == np.timedelta64(1, 'm'):
+            buffer.append(timestamp, ohlc.open, ohlc.high, ohlc.low, ohlc.close)
+        else:
+            # Gap or out of order bar - buffer is rebuilt on the next read
+            self._is_synced[asset] = False
+
+    def get_n_last_ohlc(self, n: int, asset: str) -> pd.DataFrame:
+        if n > self._capacity:
+            return self._prices_manager.get_n_last_ohlc(n, asset)
+
+        if not self._is_synced.get(asset):
+            self._sync(asset)
+
+        timestamps, prices = self._buffers[asset].last(n)
+        if not len(timestamps):
+            raise ValueError(f'\'{asset}\' does not have records in '
+                             f'\'{self.__class__.__name__}\'!')
+
+        # Buffer views are overwritten by next inserts, so data is copied
+        df = pd.DataFrame(prices, columns=self.columns, copy=True,
+                          index=pd.DatetimeIndex(timestamps, name='Timestamp', copy=True))
+        df['Asset'] = asset
+        return df
+
+    def get_n_last_bars(self, n: int, asset: str, interval: str) -> pd.DataFrame:
+        if interval == '1T':
+            return self.get_n_last_ohlc(n, asset)
+        return self._prices_manager.get_n_last_bars(n, asset, interval)
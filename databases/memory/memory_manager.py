@@ -0,0 +1,111 @@
+import datetime as dt
+
+import pandas as pd
+
+from databases.indicators_manager import StochasticIndicatorManager
+from databases.ohlc import OHLC
+from databases.prices_manager import PricesManager
+from databases.transactions_manager import TransactionsManager
+
+
+class InMemoryManager:
+    """
+    Keeps records of every asset in process memory as lists of columns
+    Meant for strategies replays and tests - nothing is persisted
+    """
+    columns = ()
+
+    def __init__(self, clock=dt.datetime.now, max_records: int = None):
+        """
+        :param clock: function returning current datetime
+        :param max_records: number of last records kept for every asset,
+        all records are kept by default
+        """
+        self._clock = clock
+        self._max_records = max_records
+        self._records = dict()
+
+    def _append(self, asset: str, timestamp: dt.datetime, *values) -> None:
+        if asset not in self._records:
+            self._records[asset] = tuple(list() for _ in range(len(self.columns) + 1))
+
+        records = self._records[asset]
+        records[0].append(timestamp)
+        for column, value in zip(records[1:], values):
+            column.append(value)
+
+        # Trimming is amortized - every column is cut only when it is
+        # twice as long as necessary
+        if self._max_records and len(records[0]) >= 2 * self._max_records:
+            for column in records:
+                del column[:-self._max_records]
+
+    def get_n_last_records(self, n: int, asset: str) -> pd.DataFrame:
+        """
+        Gets n last records of asset
+        Returns it as pandas Dataframe, same as MongoManager
+        """
+        if asset not in self._records:
+            raise ValueError(f'\'{asset}\' does not have records in '
+                             f'\'{self.__class__.__name__}\'!')
+
+        records = self._records[asset]
+        df = pd.DataFrame({column: values[-n:] for column, values
+                           in zip(self.columns, records[1:])},
+                          index=pd.DatetimeIndex(records[0][-n:], name='Timestamp'))
+        df['Asset'] = asset
+        return df
+
+    def get_all_records(self, asset: str) -> pd.DataFrame:
+        """ Returns empty DataFrame with manager columns if asset has no records """
+        if asset not in self._records:
+            df = pd.DataFrame({column: list() for column in self.columns},
+                              index=pd.DatetimeIndex(list(), name='Timestamp'))
+            df['Asset'] = asset
+            return df
+        return self.get_n_last_records(len(self._records[asset][0]), asset)
+
+
+class InMemoryPricesManager(InMemoryManager, PricesManager):
+    columns = ('Open', 'High', 'Low', 'Close')
+
+    def insert_ohlc(self, ohlc: OHLC, asset: str):
+        timestamp = ohlc.timestamp
+        if isinstance(timestamp, str):
+            timestamp = dt.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+        self._append(asset, timestamp, ohlc.open, ohlc.high, ohlc.low, ohlc.close)
+
+    def get_n_last_ohlc(self, n: int, asset: str) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
+
+
+class InMemoryTransactionsManager(InMemoryManager, TransactionsManager):
+    columns = ('Action', 'Comment')
+
+    def log(self, action: int, comment: str, asset: str):
+        self._append(asset, self._clock(), action, comment)
+
+    def get_n_last_transactions(self, n: int, asset) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
+
+    def get_current_position(self, asset: str) -> int:
+        if asset not in self._records:
+            return 0
+
+        last_comment = self._records[asset][2][-1].lower()
+        if 'closing' in last_comment:
+            return 0
+        elif 'long' in last_comment:
+            return 1
+        elif 'short' in last_comment:
+            return -1
+
+
+class InMemoryStochasticIndicatorManager(InMemoryManager, StochasticIndicatorManager):
+    columns = ('Enter_K', 'Enter_D', 'Exit_K', 'Exit_D')
+
+    def log(self, asset: str, enter_k: float, enter_d: float, exit_k: float, exit_d: float):
+        self._append(asset, self._clock(), enter_k, enter_d, exit_k, exit_d)
+
+    def get_n_last_indicators(self, n: int, asset: str) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
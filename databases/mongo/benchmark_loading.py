@@ -0,0 +1,90 @@
+"""
+Benchmark of get_n_last_records decoding - list of dicts to DataFrame
+against raw BSON batches loaded to NumPy arrays
+
+Runs on generated prices documents encoded the same way as MongoDB
+returns them, so no database is needed
+
+python -m databases.mongo.benchmark_loading --n_records 100000
+"""
+import argparse
+import datetime as dt
+import timeit
+
+import bson
+import numpy as np
+import pandas as pd
+
+from databases.mongo.bson_arrays import load_arrays
+from databases.mongo.mongo_manager import MongoPricesManager
+
+
+def make_batches(n_records: int, batch_size: int, with_id: bool) -> list:
+    """ Newest first prices documents, as sorted by Timestamp descending """
+    random_state = np.random.RandomState(0)
+    start = dt.datetime(2020, 1, 1)
+    documents = list()
+    for i in range(n_records - 1, -1, -1):
+        document = dict()
+        if with_id:
+            document['_id'] = bson.ObjectId()
+        document['Timestamp'] = start + dt.timedelta(minutes=i)
+        for field in ('Open', 'High', 'Low', 'Close'):
+            document[field] = float(random_state.rand())
+        document['Asset'] = 'EURUSD'
+        documents.append(bson.encode(document))
+    return [b''.join(documents[i:i + batch_size])
+            for i in range(0, n_records, batch_size)]
+
+
+def dicts_records(batches: list) -> pd.DataFrame:
+    """ Previous MongoManager.get_n_last_records implementation """
+    documents = list()
+    for batch in batches:
+        documents.extend(bson.decode_all(batch))
+    df = pd.DataFrame(documents)
+    df.drop('_id', axis=1, inplace=True)
+    df.set_index(pd.DatetimeIndex(df['Timestamp']), inplace=True)
+    df.drop('Timestamp', axis=1, inplace=True)
+    return df.sort_index(ascending=True)
+
+
+def arrays_records(batches: list, n_records: int) -> pd.DataFrame:
+    columns, n_loaded = load_arrays(batches, MongoPricesManager.fields, n_records)
+    assert n_loaded == n_records, f'{n_loaded} of {n_records} records loaded'
+    return MongoPricesManager._arrays_to_df(columns, 'EURUSD')
+
+
+def main(n_records: int, n_repeats: int, batch_size: int):
+    dicts_batches = make_batches(n_records, batch_size, with_id=True)
+    # New path projects only needed fields
+    arrays_batches = [b''.join(bson.encode({field: document[field] for field in MongoPricesManager.fields})
+                               for document in bson.decode_all(batch))
+                      for batch in dicts_batches]
+
+    dicts_df = dicts_records(dicts_batches)
+    arrays_df = arrays_records(arrays_batches, n_records)
+    if not np.array_equal(dicts_df.index.values, arrays_df.index.values) or \
+            not np.array_equal(dicts_df[['Open', 'High', 'Low', 'Close']].values,
+                               arrays_df[['Open', 'High', 'Low', 'Close']].values):
+        raise AssertionError('Records are different!')
+
+    dicts_time = min(timeit.repeat(
+        lambda: dicts_records(dicts_batches), number=1, repeat=n_repeats))
+    arrays_time = min(timeit.repeat(
+        lambda: arrays_records(arrays_batches, n_records), number=1, repeat=n_repeats))
+
+    print(f'Records: {n_records}')
+    print(f'list of dicts: {n_records / dicts_time:,.0f} rows/s')
+    print(f'numpy arrays: {n_records / arrays_time:,.0f} rows/s')
+    print(f'Speedup: {dicts_time / arrays_time:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n_records', type=int, help='Number of records', default=100000)
+    parser.add_argument('--n_repeats', type=int, help='Number of timing repeats', default=5)
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of documents in single raw batch', default=10000)
+    args = parser.parse_args()
+    main(args.n_records, args.n_repeats, args.batch_size)
@@ -0,0 +1,124 @@
+"""
+Decoding of raw BSON batches (find_raw_batches) straight into NumPy arrays
+
+Documents of a single query usually have identical layout - same keys
+and value types in the same order, e.g. every prices document is
+{Timestamp: datetime, Open: double, High: double, Low: double, Close: double}.
+Such batch is read with np.frombuffer using structured dtype with value
+offsets taken from the first document, without creating any Python
+objects. Batches with other layouts (strings, mixed types, missing keys)
+are decoded with bson.decode_all and copied to arrays field by field
+"""
+import struct
+from operator import itemgetter
+
+import bson
+import numpy as np
+
+# BSON element type -> (size in bytes, NumPy dtype)
+FIXED_SIZE_TYPES = {
+    b'\x01': (8, '<f8'),  # double
+    b'\x08': (1, '?'),  # boolean
+    b'\x09': (8, '<i8'),  # UTC datetime - milliseconds since epoch
+    b'\x10': (4, '<i4'),  # int32
+    b'\x12': (8, '<i8'),  # int64
+}
+DATETIME_TYPE = b'\x09'
+
+
+def _document_layout(batch: bytes) -> tuple:
+    """
+    Parses first document of a batch
+    Returns its length and {key: (type, value offset)} or None when
+    document contains values of variable size
+    """
+    length = struct.unpack_from('<i', batch)[0]
+    layout = dict()
+    position = 4
+    while batch[position:position + 1] != b'\x00':
+        element_type = batch[position:position + 1]
+        if element_type not in FIXED_SIZE_TYPES:
+            return length, None
+
+        key_end = batch.index(b'\x00', position + 1)
+        key = batch[position + 1:key_end].decode()
+        layout[key] = (element_type, key_end + 1)
+        position = key_end + 1 + FIXED_SIZE_TYPES[element_type][0]
+    return length, layout
+
+
+def _has_uniform_layout(batch: bytes, length: int, layout: dict) -> bool:
+    """ Checks that every document has the same bytes as first one except values """
+    if len(batch) % length:
+        return False
+
+    documents = np.frombuffer(batch, dtype=np.uint8).reshape(-1, length)
+    skeleton = np.ones(length, dtype=bool)
+    for element_type, offset in layout.values():
+        skeleton[offset:offset + FIXED_SIZE_TYPES[element_type][0]] = False
+    return bool((documents[:, skeleton] == documents[0, skeleton]).all())
+
+
+def _decode_uniform(batch: bytes, length: int, layout: dict, fields: dict) -> dict:
+    dtype = np.dtype({
+        'names': list(fields),
+        'formats': [FIXED_SIZE_TYPES[layout[field][0]][1] for field in fields],
+        'offsets': [layout[field][1] for field in fields],
+        'itemsize': length})
+    records = np.frombuffer(batch, dtype=dtype)
+
+    columns = dict()
+    for field in fields:
+        if layout[field][0] == DATETIME_TYPE:
+            columns[field] = records[field].view('datetime64[ms]')
+        else:
+            columns[field] = records[field]
+    return columns
+
+
+def _decode_documents(batch: bytes, fields: dict) -> dict:
+    documents = bson.decode_all(batch)
+    columns = dict()
+    for field, field_dtype in fields.items():
+        values = list(map(itemgetter(field), documents))
+        if np.dtype(field_dtype).kind in 'MO':
+            columns[field] = np.array(values, dtype=field_dtype)
+        else:
+            columns[field] = np.fromiter(values, dtype=field_dtype, count=len(values))
+    return columns
+
+
+def decode_batch(batch: bytes, fields: dict) -> dict:
+    """
+    Decodes batch of BSON documents to {field: array} of given dtypes
+    :param fields: {field name: NumPy dtype}, datetimes as 'datetime64[ms]'
+    """
+    if not batch:
+        return {field: np.empty(0, dtype=field_dtype)
+                for field, field_dtype in fields.items()}
+
+    length, layout = _document_layout(batch)
+    if layout is not None and all(field in layout for field in fields) \
+            and _has_uniform_layout(batch, length, layout):
+        return _decode_uniform(batch, length, layout, fields)
+    return _decode_documents(batch, fields)
+
+
+def load_arrays(batches, fields: dict, n: int) -> tuple:
+    """
+    Copies decoded raw batches to arrays preallocated for n documents
+    Returns {field: array} and number of loaded documents
+    """
+    columns = {field: np.empty(n, dtype=field_dtype)
+               for field, field_dtype in fields.items()}
+    n_loaded = 0
+    for batch in batches:
+        decoded = decode_batch(batch, fields)
+        n_decoded = min(len(next(iter(decoded.values()))), n - n_loaded)
+        for field, values in decoded.items():
+            columns[field][n_loaded:n_loaded + n_decoded] = values[:n_decoded]
+        n_loaded += n_decoded
+        if n_loaded == n:
+            break
+
+    return {field: values[:n_loaded] for field, values in columns.items()}, n_loaded
@@ -0,0 +1,133 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+import pymongo
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BulkWriter:
+    """
+    Write-behind pipeline for MongoDB inserts
+    Documents are put to bounded queue and inserted by background thread
+    in unordered insert_many batches. When queue is full, put blocks
+    until writer catches up (backpressure). Batches failed on network
+    errors are retried with exponential backoff. Pending documents are
+    flushed on close, which is registered to run at interpreter exit
+    """
+    _STOP = object()
+
+    def __init__(self, max_queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, max_retries: int = 5, retry_delay: float = 0.5):
+        """
+        :param max_queue_size: number of documents waiting for insert
+        after which put blocks
+        :param batch_size: max number of documents in single insert_many
+        :param flush_interval: max number of seconds document waits
+        in writer before it is inserted
+        :param max_retries: number of retries of batch failed on network error
+        :param retry_delay: seconds before the first retry, doubled with every next one
+        """
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._thread = None
+        self._lock = threading.Lock()
+        self._is_closed = False
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='MongoBulkWriter', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def put(self, collection: pymongo.collection.Collection, document: dict) -> None:
+        if self._is_closed:
+            raise RuntimeError('BulkWriter is closed!')
+        if self._thread is None:
+            self._start()
+        self._queue.put((collection, document))
+
+    def flush(self) -> None:
+        """ Blocks until all documents put so far are inserted """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """ Inserts pending documents and stops writer thread """
+        if self._is_closed:
+            return
+        self._is_closed = True
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self) -> None:
+        is_stopped = False
+        while not is_stopped:
+            batch = list()
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(timeout, 0)) \
+                        if batch else self._queue.get()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    self._queue.task_done()
+                    is_stopped = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            except Exception:
+                # Writer thread must survive, otherwise flush and put block forever
+                logger.exception(f'Writing batch of {len(batch)} documents failed!')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        documents = dict()
+        for collection, document in batch:
+            documents.setdefault(collection.full_name, (collection, list()))[1].append(document)
+
+        for collection, collection_documents in documents.values():
+            try:
+                self._insert_many(collection, collection_documents)
+            except Exception:
+                logger.exception(f'Inserting {len(collection_documents)} documents '
+                                 f'to \'{collection.name}\' collection failed!')
+
+    def _insert_many(self, collection: pymongo.collection.Collection, documents: list) -> None:
+        for attempt in range(self._max_retries + 1):
+            try:
+                collection.insert_many(documents, ordered=False)
+                return
+            except BulkWriteError as e:
+                # insert_many sets _id of documents, so documents inserted
+                # by failed attempt are duplicates in the next one
+                write_errors = [error for error in e.details.get('writeErrors', list())
+                                if error.get('code') != DUPLICATE_KEY_ERROR or attempt == 0]
+                if write_errors or e.details.get('writeConcernErrors'):
+                    raise
+                return
+            except ConnectionFailure as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = self._retry_delay * 2 ** attempt
+                logger.warning(f'Inserting {len(documents)} documents to \'{collection.name}\' '
+                               f'collection failed: {e}, retrying in {delay} s')
+                time.sleep(delay)
@@ -0,0 +1,212 @@
+"""
+Process-wide registry of MongoDB clients
+
+Every manager connected to the same host shares one MongoClient, so
+all of them use one connection pool. Clients are created with pool
+limits and timeouts from config, report operations latency and pool
+wait time to MongoMetrics and are pinged by MongoHealthCheck thread
+"""
+import logging
+import threading
+import time
+
+import pymongo
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+from databases.mongo.config import (MAX_POOL_SIZE, MIN_POOL_SIZE, WAIT_QUEUE_TIMEOUT_MS,
+                                   SERVER_SELECTION_TIMEOUT_MS, CONNECT_TIMEOUT_MS,
+                                   SOCKET_TIMEOUT_MS, HEALTH_CHECK_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+
+class MongoMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """
+    Collects operations latency and connection pool wait time
+    Registered as pymongo event listener of a single client
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._check_out_starts = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._n_operations = 0
+            self._n_failed_operations = 0
+            self._operations_time = 0.
+            self._max_operation_time = 0.
+            self._n_check_outs = 0
+            self._n_failed_check_outs = 0
+            self._pool_wait_time = 0.
+            self._max_pool_wait_time = 0.
+
+    def snapshot(self) -> dict:
+        """ Returns metrics collected since the last reset, times in ms """
+        with self._lock:
+            return {
+                'operations': self._n_operations,
+                'failed_operations': self._n_failed_operations,
+                'mean_operation_ms': 1000 * self._operations_time / max(self._n_operations, 1),
+                'max_operation_ms': 1000 * self._max_operation_time,
+                'check_outs': self._n_check_outs,
+                'failed_check_outs': self._n_failed_check_outs,
+                'mean_pool_wait_ms': 1000 * self._pool_wait_time / max(self._n_check_outs, 1),
+                'max_pool_wait_ms': 1000 * self._max_pool_wait_time}
+
+    def _add_operation(self, duration: float, is_failed: bool) -> None:
+        with self._lock:
+            self._n_operations += 1
+            self._n_failed_operations += is_failed
+            self._operations_time += duration
+            self._max_operation_time = max(self._max_operation_time, duration)
+
+    def _add_check_out(self, is_failed: bool) -> None:
+        # Check out events are published by the thread which waits
+        start = getattr(self._check_out_starts, 'value', None)
+        if start is None:
+            return
+        self._check_out_starts.value = None
+        wait_time = time.monotonic() - start
+        with self._lock:
+            self._n_check_outs += 1
+            self._n_failed_check_outs += is_failed
+            self._pool_wait_time += wait_time
+            self._max_pool_wait_time = max(self._max_pool_wait_time, wait_time)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._add_operation(event.duration_micros / 1e6, False)
+
+    def failed(self, event):
+        self._add_operation(event.duration_micros / 1e6, True)
+
+    def connection_check_out_started(self, event):
+        self._check_out_starts.value = time.monotonic()
+
+    def connection_checked_out(self, event):
+        self._add_check_out(False)
+
+    def connection_check_out_failed(self, event):
+        self._add_check_out(True)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class MongoHealthCheck:
+    """ Daemon thread pinging MongoDB every interval seconds """
+    def __init__(self, client: pymongo.MongoClient, host: str, interval: float):
+        self._client = client
+        self._host = host
+        self._interval = interval
+        self._is_healthy = None
+        self._last_ping_ms = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='MongoHealthCheck', daemon=True)
+
+    @property
+    def is_healthy(self) -> bool:
+        """ Result of the last ping, None before the first one """
+        return self._is_healthy
+
+    @property
+    def last_ping_ms(self) -> float:
+        return self._last_ping_ms
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def ping(self) -> bool:
+        start = time.monotonic()
+        try:
+            self._client.admin.command('ping')
+        except PyMongoError as e:
+            is_healthy = False
+            if self._is_healthy is not False:
+                logger.error(f'MongoDB {self._host} is not available: {e}')
+        else:
+            is_healthy = True
+            self._last_ping_ms = 1000 * (time.monotonic() - start)
+            if self._is_healthy is False:
+                logger.warning(f'MongoDB {self._host} is available again')
+        self._is_healthy = is_healthy
+        return is_healthy
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.ping()
+            self._stop.wait(self._interval)
+
+
+# host -> (client, metrics, health check)
+_clients = dict()
+_lock = threading.Lock()
+
+
+def get_client(host: str) -> pymongo.MongoClient:
+    """ Returns client of host, created on the first call """
+    with _lock:
+        if host not in _clients:
+            metrics = MongoMetrics()
+            client = pymongo.MongoClient(
+                host,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=SOCKET_TIMEOUT_MS,
+                retryWrites=True,
+                retryReads=True,
+                event_listeners=[metrics])
+            health_check = MongoHealthCheck(client, host, HEALTH_CHECK_INTERVAL)
+            health_check.start()
+            _clients[host] = (client, metrics, health_check)
+        return _clients[host][0]
+
+
+def get_metrics(host: str) -> MongoMetrics:
+    get_client(host)
+    return _clients[host][1]
+
+
+def get_health_check(host: str) -> MongoHealthCheck:
+    get_client(host)
+    return _clients[host][2]
+
+
+def close_clients() -> None:
+    with _lock:
+        for client, metrics, health_check in _clients.values():
+            health_check.stop()
+            client.close()
+        _clients.clear()
@@ -2,3 +2,36 @@ DB_NAME = 'Trai_db'
 PRICES_COLLECTION_NAME = 'prices'
 TRANSACTIONS_COLLECTION_NAME = 'transactions'
 STOCHASTIC_COLLECTION_NAME = 'stochastic'
+
+# Higher timeframe bars kept in '<prices collection>_<interval>' collections
+AGGREGATED_INTERVALS = ('5T', '15T', '1H')
+
+# Raw stochastic rows expire after retention, older history is kept
+# in hourly / daily rollups in '<stochastic collection>_<interval>' collections
+STOCHASTIC_RETENTION_DAYS = 30
+STOCHASTIC_ROLLUP_INTERVALS = ('1H', '1D')
+# Max number of indicator rows read for a time range - coarser
+# resolution is chosen when range has more raw rows
+MAX_INDICATOR_POINTS = 5000
+
+# Client shared by all managers of a process (see client_registry)
+MAX_POOL_SIZE = 20
+MIN_POOL_SIZE = 2
+WAIT_QUEUE_TIMEOUT_MS = 2000
+# Per minute jobs should fail fast rather than miss the next minute
+SERVER_SELECTION_TIMEOUT_MS = 3000
+CONNECT_TIMEOUT_MS = 3000
+SOCKET_TIMEOUT_MS = 10000
+HEALTH_CHECK_INTERVAL = 30  # seconds
+
+# Create new collections as MongoDB (5.0+) time series collections
+USE_TIME_SERIES_COLLECTIONS = False
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Write-behind inserts of prices and indicators (see BulkWriter)
+USE_WRITE_BEHIND = True
+WRITE_BEHIND_QUEUE_SIZE = 10000
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5  # seconds
+WRITE_BEHIND_MAX_RETRIES = 5  # of batch failed on network error
+WRITE_BEHIND_RETRY_DELAY = 0.5  # seconds, doubled with every retry
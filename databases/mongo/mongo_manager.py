@@ -1,73 +1,280 @@
 import abc
 import datetime as dt
 
+import numpy as np
 import pandas as pd
 import pymongo
+from pymongo.errors import CollectionInvalid
+from pymongo.write_concern import WriteConcern
 
+from databases.bar_aggregator import BarAggregator, get_bar_start, interval_minutes
 from databases.indicators_manager import StochasticIndicatorManager
 from databases.ohlc import OHLC
 from databases.prices_manager import PricesManager
 from databases.transactions_manager import TransactionsManager
-from databases.utils import SharedBetweenInstances
-from databases.mongo.config import DB_NAME, PRICES_COLLECTION_NAME, TRANSACTIONS_COLLECTION_NAME, STOCHASTIC_COLLECTION_NAME
+from databases.mongo.bson_arrays import decode_batch, load_arrays
+from databases.mongo.bulk_writer import BulkWriter
+from databases.mongo.client_registry import get_client
+from databases.mongo.config import (DB_NAME, PRICES_COLLECTION_NAME, AGGREGATED_INTERVALS, TRANSACTIONS_COLLECTION_NAME,
+                                   STOCHASTIC_COLLECTION_NAME, USE_TIME_SERIES_COLLECTIONS, TIMESTAMP_FORMAT,
+                                   USE_WRITE_BEHIND, WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_BATCH_SIZE,
+                                   WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_RETRIES,
+                                   WRITE_BEHIND_RETRY_DELAY, STOCHASTIC_RETENTION_DAYS,
+                                   STOCHASTIC_ROLLUP_INTERVALS, MAX_INDICATOR_POINTS)
 
 
 class MongoManager(abc.ABC):
-    def __init__(self, host: str):
-        self._mongo_client = pymongo.MongoClient(host)
+    # Record fields (without Asset) and their NumPy dtypes
+    fields = {'Timestamp': 'datetime64[ms]'}
+
+    def __init__(self, host: str, write_behind: bool = False):
+        """
+        :param write_behind: if True, documents are inserted
+        asynchronously in batches by BulkWriter
+        """
+        # Client is shared by all managers of host, collections are per instance
+        self._mongo_client = get_client(host)
         self._database = self._mongo_client[DB_NAME]
         self._collection = None
+        self._writer = None
+        if write_behind:
+            self._writer = BulkWriter(max_queue_size=WRITE_BEHIND_QUEUE_SIZE,
+                                      batch_size=WRITE_BEHIND_BATCH_SIZE,
+                                      flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                                      max_retries=WRITE_BEHIND_MAX_RETRIES,
+                                      retry_delay=WRITE_BEHIND_RETRY_DELAY)
+
+    def _init_collection(self, name: str, time_series: bool = USE_TIME_SERIES_COLLECTIONS,
+                         unique: bool = False) -> pymongo.collection.Collection:
+        """
+        Bootstraps collection schema - creates collection (time series if
+        configured), migrates string timestamps to BSON datetimes and
+        creates compound (Asset, Timestamp) index
+        :param unique: if True, (Asset, Timestamp) index is unique,
+        not supported by time series collections
+        """
+        if name not in self._database.list_collection_names():
+            options = dict()
+            if time_series:
+                options['timeseries'] = {'timeField': 'Timestamp',
+                                         'metaField': 'Asset',
+                                         'granularity': 'minutes'}
+            try:
+                self._database.create_collection(name, **options)
+            except CollectionInvalid:
+                # Created by another manager in the meantime
+                pass
 
-    def get_n_last_records(self, n: int, asset: str) -> pd.DataFrame:
+        collection = self._database[name]
+        self._migrate_timestamps(collection)
+        collection.create_index([('Asset', pymongo.ASCENDING),
+                                 ('Timestamp', pymongo.DESCENDING)],
+                                name='asset_timestamp', unique=unique)
+        return collection
+
+    def _set_expiry(self, collection: pymongo.collection.Collection,
+                    expire_after_seconds: int) -> None:
+        """
+        Removes documents older than expire_after_seconds - TTL index of
+        time series collection option. Changed retention is applied with
+        collMod, create_index of existing index with other options fails
+        """
+        options = collection.options()
+        if 'timeseries' in options:
+            if options.get('expireAfterSeconds') != expire_after_seconds:
+                self._database.command('collMod', collection.name,
+                                       expireAfterSeconds=expire_after_seconds)
+            return
+
+        index = collection.index_information().get('timestamp_ttl')
+        if index is None:
+            collection.create_index('Timestamp', name='timestamp_ttl',
+                                    expireAfterSeconds=expire_after_seconds)
+        elif index.get('expireAfterSeconds') != expire_after_seconds:
+            self._database.command('collMod', collection.name, index={
+                'name': 'timestamp_ttl', 'expireAfterSeconds': expire_after_seconds})
+
+    @staticmethod
+    def _migrate_timestamps(collection: pymongo.collection.Collection,
+                            batch_size: int = 10000) -> None:
+        """ Converts string timestamps written by previous versions """
+        query = {'Timestamp': {'$type': 'string'}}
+        if not collection.count_documents(query, limit=1):
+            return
+
+        requests = list()
+        for document in collection.find(query, {'Timestamp': 1}):
+            timestamp = dt.datetime.strptime(document['Timestamp'], TIMESTAMP_FORMAT)
+            requests.append(pymongo.UpdateOne({'_id': document['_id']},
+                                              {'$set': {'Timestamp': timestamp}}))
+            if len(requests) == batch_size:
+                collection.bulk_write(requests, ordered=False)
+                requests = list()
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+
+    def _insert(self, document: dict,
+                collection: pymongo.collection.Collection = None) -> None:
+        if collection is None:
+            collection = self._collection
+        if self._writer is not None:
+            self._writer.put(collection, document)
+        else:
+            collection.insert_one(document)
+
+    def flush(self) -> None:
+        """ Waits until all write-behind inserts are done """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def get_n_last_records(self, n: int, asset: str,
+                           collection: pymongo.collection.Collection = None) -> pd.DataFrame:
         """
         Gets n last records from object MongoDB collection
+        (or given collection with the same fields)
         Returns it as pandas Dataframe
         """
-        df = pd.DataFrame(list(self._collection.find({'Asset': asset}).limit(n).sort('$natural', -1)))
-        if df.empty:
+        if collection is None:
+            collection = self._collection
+        self.flush()
+        projection = dict.fromkeys(self.fields, 1)
+        projection['_id'] = 0
+        batches = collection.find_raw_batches({'Asset': asset}, projection).sort(
+            'Timestamp', pymongo.DESCENDING).limit(n)
+        columns, n_loaded = load_arrays(batches, self.fields, n)
+        if not n_loaded:
             raise ValueError(f'\'{asset}\' does not have records in '
-                             f'\'{self._collection.name}\' collection!')
+                             f'\'{collection.name}\' collection!')
+
+        return self._arrays_to_df(columns, asset)
+
+    def get_records_between(self, asset: str, start: dt.datetime, end: dt.datetime,
+                            collection: pymongo.collection.Collection = None) -> pd.DataFrame:
+        """
+        Gets records with timestamps from start to end (both included)
+        Returns it as pandas Dataframe, empty when there are no records
+        """
+        if collection is None:
+            collection = self._collection
+        self.flush()
+        projection = dict.fromkeys(self.fields, 1)
+        projection['_id'] = 0
+        query = {'Asset': asset, 'Timestamp': {'$gte': start, '$lte': end}}
+        batches = [decode_batch(batch, self.fields) for batch in collection.find_raw_batches(
+            query, projection).sort('Timestamp', pymongo.DESCENDING)]
 
-        df.set_index(pd.DatetimeIndex(df['Timestamp']), inplace=True)
-        df.drop('Timestamp', axis=1, inplace=True)
-        return df.sort_index(ascending=True)
+        columns = {field: np.concatenate([batch[field] for batch in batches])
+                   if batches else np.empty(0, dtype=field_dtype)
+                   for field, field_dtype in self.fields.items()}
+        return self._arrays_to_df(columns, asset)
+
+    @staticmethod
+    def _arrays_to_df(columns: dict, asset: str) -> pd.DataFrame:
+        """ Builds DataFrame on arrays of records read newest first """
+        # Reversed views give ascending order without copying
+        timestamps = columns.pop('Timestamp')[::-1]
+        df = pd.DataFrame({field: values[::-1] for field, values in columns.items()},
+                          index=pd.DatetimeIndex(timestamps, name='Timestamp'), copy=False)
+        df['Asset'] = asset
+        return df
 
 
 class MongoPricesManager(MongoManager, PricesManager):
-    _mongo_client = SharedBetweenInstances()
-    _database = SharedBetweenInstances()
-    _collection = SharedBetweenInstances()
+    fields = {'Timestamp': 'datetime64[ms]', 'Open': 'float64', 'High': 'float64',
+              'Low': 'float64', 'Close': 'float64'}
 
-    def __init__(self, host: str):
-        super().__init__(host)
-        self._collection = self._database[PRICES_COLLECTION_NAME]
+    def __init__(self, host: str, write_behind: bool = USE_WRITE_BEHIND,
+                 intervals: tuple = AGGREGATED_INTERVALS):
+        """
+        :param intervals: higher timeframe intervals, which bars are
+        aggregated on insert and kept in separate collections
+        """
+        super().__init__(host, write_behind)
+        self._collection = self._init_collection(PRICES_COLLECTION_NAME)
+        self._aggregator = BarAggregator(intervals)
+        self._restored_assets = set()
+        self._bar_collections = {
+            interval: self._init_collection(f'{PRICES_COLLECTION_NAME}_{interval}')
+            for interval in intervals}
 
-    def insert_ohlc(self, ohlc: OHLC, asset: str):
-        ohlc_to_insert = {
-            'Timestamp': ohlc.timestamp,
+    @staticmethod
+    def _to_document(ohlc: OHLC, asset: str) -> dict:
+        timestamp = ohlc.timestamp
+        if isinstance(timestamp, str):
+            timestamp = dt.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        return {
+            'Timestamp': timestamp,
             'Open': ohlc.open,
             'High': ohlc.high,
             'Low': ohlc.low,
             'Close': ohlc.close,
             'Asset': asset}
-        self._collection.insert_one(ohlc_to_insert)
+
+    def _restore_current_bars(self, timestamp: dt.datetime, asset: str) -> None:
+        """
+        Feeds aggregator with 1 minute bars inserted before restart,
+        which belong to unfinished bars - they are already persisted
+        """
+        longest_interval = max(self._aggregator.intervals, key=interval_minutes.get)
+        start = get_bar_start(timestamp, longest_interval)
+        try:
+            market_data = self.get_n_last_ohlc(interval_minutes[longest_interval], asset)
+        except ValueError:
+            return
+
+        market_data = market_data.loc[(market_data.index >= start) &
+                                      (market_data.index < timestamp)]
+        for bar_timestamp, bar in market_data.iterrows():
+            self._aggregator.add_ohlc(OHLC(bar_timestamp.to_pydatetime(), bar['Open'],
+                                           bar['High'], bar['Low'], bar['Close']), asset)
+
+    def insert_ohlc(self, ohlc: OHLC, asset: str):
+        ohlc_to_insert = self._to_document(ohlc, asset)
+        if self._bar_collections and asset not in self._restored_assets:
+            self._restore_current_bars(ohlc_to_insert['Timestamp'], asset)
+            self._restored_assets.add(asset)
+        self._insert(ohlc_to_insert)
+
+        for interval, bar in self._aggregator.add_ohlc(ohlc, asset):
+            self._insert(self._to_document(bar, asset), self._bar_collections[interval])
 
     def get_n_last_ohlc(self, n: int, asset: str) -> pd.DataFrame:
         return self.get_n_last_records(n, asset)
 
+    def get_n_last_bars(self, n: int, asset: str, interval: str) -> pd.DataFrame:
+        if interval not in self._bar_collections:
+            return super().get_n_last_bars(n, asset, interval)
+
+        bar = self._aggregator.get_current_bar(asset, interval)
+        if bar is None:
+            return self.get_n_last_records(n, asset, self._bar_collections[interval])
+
+        current_bar = pd.DataFrame(
+            {'Open': [bar.open], 'High': [bar.high], 'Low': [bar.low],
+             'Close': [bar.close], 'Asset': [asset]},
+            index=pd.DatetimeIndex([bar.timestamp], name='Timestamp'))
+        if n == 1:
+            return current_bar
+        try:
+            bars = self.get_n_last_records(n - 1, asset, self._bar_collections[interval])
+        except ValueError:
+            return current_bar
+        return pd.concat([bars, current_bar])
+
 
 class MongoTransactionsManager(MongoManager, TransactionsManager):
-    _mongo_client = SharedBetweenInstances()
-    _database = SharedBetweenInstances()
-    _collection = SharedBetweenInstances()
+    fields = {'Timestamp': 'datetime64[ms]', 'Action': 'int64', 'Comment': 'object'}
 
     def __init__(self, host: str):
         super().__init__(host)
-        self._collection = self._database[TRANSACTIONS_COLLECTION_NAME]
+        # Transactions are always written synchronously and acknowledged
+        # after being journaled - positions are restored from them
+        self._collection = self._init_collection(TRANSACTIONS_COLLECTION_NAME).with_options(
+            write_concern=WriteConcern(w=1, j=True))
 
     def log(self, action: int, comment: str, asset: str):
         self._collection.insert_one({
-            'Timestamp': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'Timestamp': dt.datetime.now().replace(microsecond=0),
             'Action': action,
             'Comment': comment,
             'Asset': asset})
@@ -90,17 +297,88 @@ class MongoTransactionsManager(MongoManager, TransactionsManager):
 
 
 class MongoStochasticIndicatorManager(MongoManager, StochasticIndicatorManager):
-    _mongo_client = SharedBetweenInstances()
-    _database = SharedBetweenInstances()
-    _collection = SharedBetweenInstances()
+    fields = {'Timestamp': 'datetime64[ms]', 'Enter_K': 'float64', 'Enter_D': 'float64',
+              'Exit_K': 'float64', 'Exit_D': 'float64'}
 
-    def __init__(self, host: str):
-        super().__init__(host)
-        self._collection = self._database[STOCHASTIC_COLLECTION_NAME]
+    def __init__(self, host: str, write_behind: bool = USE_WRITE_BEHIND,
+                 retention_days: int = STOCHASTIC_RETENTION_DAYS,
+                 rollup_intervals: tuple = STOCHASTIC_ROLLUP_INTERVALS):
+        """
+        :param retention_days: raw per minute rows are removed after
+        that many days, None keeps them forever
+        :param rollup_intervals: '1H' and / or '1D' summaries, updated
+        by rollup method
+        """
+        super().__init__(host, write_behind)
+        self._retention = None
+        if retention_days is not None:
+            self._retention = dt.timedelta(days=retention_days)
+        self._collection = self._init_collection(STOCHASTIC_COLLECTION_NAME)
+        # Rollups are written with $merge, which needs unique index
+        self._rollup_collections = {
+            interval: self._init_collection(f'{STOCHASTIC_COLLECTION_NAME}_{interval}',
+                                            time_series=False, unique=True)
+            for interval in rollup_intervals}
+        if self._retention is not None:
+            # Rows not summarized yet would be lost to the first TTL pass
+            if self._rollup_collections:
+                self.rollup()
+            self._set_expiry(self._collection, int(self._retention.total_seconds()))
+
+    def rollup(self) -> None:
+        """
+        Averages raw rows to hourly / daily summaries
+        Incremental - only buckets from the last summarized one are
+        recalculated, meant to be run periodically
+        """
+        self.flush()
+        for interval, collection in self._rollup_collections.items():
+            last_bucket = collection.find_one(
+                {}, {'Timestamp': 1}, sort=[('Timestamp', pymongo.DESCENDING)])
+            query = dict()
+            if last_bucket is not None:
+                query['Timestamp'] = {'$gte': last_bucket['Timestamp']}
+
+            date_parts = {'year': {'$year': '$Timestamp'},
+                          'month': {'$month': '$Timestamp'},
+                          'day': {'$dayOfMonth': '$Timestamp'}}
+            if interval == '1H':
+                date_parts['hour'] = {'$hour': '$Timestamp'}
+            values = [field for field in self.fields if field != 'Timestamp']
+
+            self._collection.aggregate([
+                {'$match': query},
+                {'$group': dict(
+                    _id={'Asset': '$Asset', 'Timestamp': {'$dateFromParts': date_parts}},
+                    **{field: {'$avg': f'${field}'} for field in values})},
+                {'$project': dict(
+                    _id=0, Asset='$_id.Asset', Timestamp='$_id.Timestamp',
+                    **dict.fromkeys(values, 1))},
+                {'$merge': {'into': collection.name, 'on': ['Asset', 'Timestamp'],
+                            'whenMatched': 'replace', 'whenNotMatched': 'insert'}}])
+
+    def get_indicators_between(self, asset: str, start: dt.datetime, end: dt.datetime,
+                               max_points: int = MAX_INDICATOR_POINTS) -> pd.DataFrame:
+        """
+        Gets indicators from start to end in the finest resolution which
+        gives at most max_points rows and is still kept - raw per minute
+        rows, hourly or daily summaries
+        """
+        n_minutes = (end - start).total_seconds() / 60
+        is_retained = self._retention is None or \
+            start >= dt.datetime.now() - self._retention
+        if (n_minutes <= max_points and is_retained) or not self._rollup_collections:
+            return self.get_records_between(asset, start, end)
+
+        for interval, collection in sorted(self._rollup_collections.items(),
+                                           key=lambda item: interval_minutes[item[0]]):
+            if n_minutes / interval_minutes[interval] <= max_points:
+                break
+        return self.get_records_between(asset, start, end, collection)
 
     def log(self, asset: str, enter_k: int, enter_d: int, exit_k: int, exit_d: int):
-        self._collection.insert_one({
-            'Timestamp': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        self._insert({
+            'Timestamp': dt.datetime.now().replace(microsecond=0),
             'Enter_K': round(enter_k, 2),
             'Enter_D': round(enter_d, 2),
             'Exit_K': round(exit_k, 2),
@@ -27,9 +27,12 @@ class OHLC:
         self.print_color = print_color
 
     @classmethod
-    def from_prices_list(cls, prices_list: list, print_color: str):
-        shifted_time = dt.datetime.now() - dt.timedelta(minutes=1)
-        return cls(timestamp=shifted_time.strftime('%Y-%m-%d %H:%M:%S'),
+    def from_prices_list(cls, prices_list: list, print_color: str,
+                         timestamp: dt.datetime = None):
+        """ :param timestamp: bar start, by default the previous minute """
+        if timestamp is None:
+            timestamp = dt.datetime.now() - dt.timedelta(minutes=1)
+        return cls(timestamp=timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                    open=prices_list[0],
                    high=max(prices_list),
                    low=min(prices_list),
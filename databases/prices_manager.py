@@ -1,7 +1,9 @@
 import abc
 import pandas as pd
 
+from .bar_aggregator import interval_minutes
 from .ohlc import OHLC
+from data_preprocessing.market_data_preprocessing import aggregate_ohlc
 
 
 class PricesManager(abc.ABC):
@@ -14,3 +16,17 @@ class PricesManager(abc.ABC):
     def get_n_last_ohlc(self, n: int, asset: str) -> pd.DataFrame:
         pass
 
+    def get_n_last_bars(self, n: int, asset: str, interval: str) -> pd.DataFrame:
+        """
+        Gets n last bars of interval, the last one may be unfinished
+        By default aggregated from 1 minute OHLC, managers which keep
+        pre-aggregated bars override it
+        """
+        if interval == '1T':
+            return self.get_n_last_ohlc(n, asset)
+
+        n_minutes = interval_minutes[interval]
+        market_data = self.get_n_last_ohlc(n * n_minutes + n_minutes, asset)
+        bars = aggregate_ohlc(market_data[['Open', 'High', 'Low', 'Close']], interval)
+        bars['Asset'] = asset
+        return bars.iloc[-n:]
@@ -0,0 +1,11 @@
+PRICES_TABLE_NAME = 'prices'
+TRANSACTIONS_TABLE_NAME = 'transactions'
+STOCHASTIC_TABLE_NAME = 'stochastic'
+
+# Prices and indicators are committed in batches, at most COMMIT_INTERVAL
+# seconds after the first uncommitted write - transactions are committed immediately
+COMMIT_BATCH_SIZE = 100
+COMMIT_INTERVAL = 5  # seconds
+# WAL journal is synced on checkpoints only, database stays consistent
+# after a crash, last commits may be lost after a power failure
+SYNCHRONOUS = 'NORMAL'
@@ -0,0 +1,198 @@
+import abc
+import atexit
+import datetime as dt
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from databases.indicators_manager import StochasticIndicatorManager
+from databases.ohlc import OHLC
+from databases.prices_manager import PricesManager
+from databases.transactions_manager import TransactionsManager
+from databases.sqlite.config import (PRICES_TABLE_NAME, TRANSACTIONS_TABLE_NAME, STOCHASTIC_TABLE_NAME,
+                                    COMMIT_BATCH_SIZE, COMMIT_INTERVAL, SYNCHRONOUS)
+
+
+def to_milliseconds(timestamp) -> int:
+    """ Converts OHLC timestamp (datetime or string) to milliseconds since epoch """
+    if isinstance(timestamp, str):
+        timestamp = dt.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    return int(np.datetime64(timestamp, 'ms').astype(np.int64))
+
+
+class SQLiteDatabase:
+    """
+    Single SQLite connection in WAL mode shared by all managers of a file
+    Connection is used by TradingEngine thread pool, so every access is locked.
+    Writes are kept in open transaction, which is committed after
+    COMMIT_BATCH_SIZE writes or on demand - and by timer COMMIT_INTERVAL
+    seconds after it began, so no write stays uncommitted when writes stop
+    """
+    _databases = dict()
+    _databases_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+        self.lock = threading.RLock()
+        self._n_pending = 0
+        atexit.register(self.commit)
+
+    @classmethod
+    def get(cls, path: str) -> 'SQLiteDatabase':
+        with cls._databases_lock:
+            if path not in cls._databases:
+                cls._databases[path] = cls(path)
+            return cls._databases[path]
+
+    def execute_script(self, script: str) -> None:
+        with self.lock:
+            self._connection.executescript(script)
+
+    def write(self, sql: str, parameters: tuple, commit: bool = False) -> None:
+        with self.lock:
+            if not self._connection.in_transaction:
+                self._connection.execute('BEGIN')
+                self._start_commit_timer()
+            self._connection.execute(sql, parameters)
+            self._n_pending += 1
+            if commit or self._n_pending >= COMMIT_BATCH_SIZE:
+                self.commit()
+
+    def _start_commit_timer(self) -> None:
+        timer = threading.Timer(COMMIT_INTERVAL, self.commit)
+        timer.daemon = True
+        timer.start()
+
+    def commit(self) -> None:
+        with self.lock:
+            if self._connection.in_transaction:
+                self._connection.execute('COMMIT')
+            self._n_pending = 0
+
+    def read(self, sql: str, parameters: tuple) -> list:
+        # Reads in the same connection see not yet committed writes
+        with self.lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+
+class SQLiteManager(abc.ABC):
+    """
+    Records of every asset in table with (asset, timestamp) primary key,
+    timestamps are kept as milliseconds since epoch
+    """
+    table_name = None
+    columns = ()
+    column_types = ()
+    insert_statement = 'INSERT OR REPLACE'
+    order_by = 'timestamp DESC'
+
+    def __init__(self, path: str):
+        self._database = SQLiteDatabase.get(path)
+        self._database.execute_script(self._get_schema())
+
+        columns = ', '.join(self.columns)
+        self._insert_sql = f'{self.insert_statement} INTO {self.table_name} ' \
+                           f'(asset, timestamp, {columns}) ' \
+                           f'VALUES (?, ?{", ?" * len(self.columns)})'
+        self._select_sql = f'SELECT timestamp, {columns} FROM {self.table_name} ' \
+                           f'WHERE asset = ? ORDER BY {self.order_by} LIMIT ?'
+
+    def _get_schema(self) -> str:
+        columns = ', '.join(f'{column} {column_type}' for column, column_type
+                            in zip(self.columns, self.column_types))
+        return f'CREATE TABLE IF NOT EXISTS {self.table_name} (' \
+               f'asset TEXT NOT NULL, timestamp INTEGER NOT NULL, {columns}, ' \
+               f'PRIMARY KEY (asset, timestamp)) WITHOUT ROWID;'
+
+    def _insert(self, asset: str, timestamp: int, *values, commit: bool = False) -> None:
+        self._database.write(self._insert_sql, (asset, timestamp) + values, commit)
+
+    def flush(self) -> None:
+        self._database.commit()
+
+    def get_n_last_records(self, n: int, asset: str) -> pd.DataFrame:
+        """
+        Gets n last records of asset
+        Returns it as pandas Dataframe, same as MongoManager
+        """
+        rows = self._database.read(self._select_sql, (asset, n))
+        if not rows:
+            raise ValueError(f'\'{asset}\' does not have records in '
+                             f'\'{self.table_name}\' table!')
+
+        # Rows are read newest first
+        values = list(zip(*reversed(rows)))
+        df = pd.DataFrame(
+            {column: column_values for column, column_values in zip(self.columns, values[1:])},
+            index=pd.DatetimeIndex(np.array(values[0], dtype='datetime64[ms]'), name='Timestamp'))
+        df['Asset'] = asset
+        return df
+
+
+class SQLitePricesManager(SQLiteManager, PricesManager):
+    table_name = PRICES_TABLE_NAME
+    columns = ('Open', 'High', 'Low', 'Close')
+    column_types = ('REAL', 'REAL', 'REAL', 'REAL')
+
+    def insert_ohlc(self, ohlc: OHLC, asset: str):
+        self._insert(asset, to_milliseconds(ohlc.timestamp),
+                     ohlc.open, ohlc.high, ohlc.low, ohlc.close)
+
+    def get_n_last_ohlc(self, n: int, asset: str) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
+
+
+class SQLiteTransactionsManager(SQLiteManager, TransactionsManager):
+    table_name = TRANSACTIONS_TABLE_NAME
+    columns = ('Action', 'Comment')
+    column_types = ('INTEGER', 'TEXT')
+    insert_statement = 'INSERT'
+    order_by = 'timestamp DESC, id DESC'
+
+    def _get_schema(self) -> str:
+        # Closing and opening transactions may be logged in the same
+        # millisecond, so insertion order (rowid) is a part of the key
+        return f'CREATE TABLE IF NOT EXISTS {self.table_name} (' \
+               f'id INTEGER PRIMARY KEY, asset TEXT NOT NULL, ' \
+               f'timestamp INTEGER NOT NULL, Action INTEGER, Comment TEXT); ' \
+               f'CREATE INDEX IF NOT EXISTS {self.table_name}_asset_timestamp ' \
+               f'ON {self.table_name} (asset, timestamp, id);'
+
+    def log(self, action: int, comment: str, asset: str):
+        # Positions are restored from transactions - committed immediately
+        self._insert(asset, to_milliseconds(dt.datetime.now()), action, comment, commit=True)
+
+    def get_n_last_transactions(self, n: int, asset) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
+
+    def get_current_position(self, asset: str) -> int:
+        try:
+            last_transaction = self.get_n_last_transactions(1, asset)
+        except ValueError:
+            return 0
+        else:
+            last_comment = last_transaction['Comment'].values[0].lower()
+            if 'closing' in last_comment:
+                return 0
+            elif 'long' in last_comment:
+                return 1
+            elif 'short' in last_comment:
+                return -1
+
+
+class SQLiteStochasticIndicatorManager(SQLiteManager, StochasticIndicatorManager):
+    table_name = STOCHASTIC_TABLE_NAME
+    columns = ('Enter_K', 'Enter_D', 'Exit_K', 'Exit_D')
+    column_types = ('REAL', 'REAL', 'REAL', 'REAL')
+
+    def log(self, asset: str, enter_k: float, enter_d: float, exit_k: float, exit_d: float):
+        self._insert(asset, to_milliseconds(dt.datetime.now().replace(microsecond=0)),
+                     round(enter_k, 2), round(enter_d, 2), round(exit_k, 2), round(exit_d, 2))
+
+    def get_n_last_indicators(self, n: int, asset: str) -> pd.DataFrame:
+        return self.get_n_last_records(n, asset)
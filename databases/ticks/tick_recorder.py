@@ -0,0 +1,203 @@
+"""
+Tick prices persistence in per asset, per day append-only segment files
+
+Segment '<directory>/<asset>/<YYYY-MM-DD>.ticks' is a sequence of blocks,
+each written at once and synced by TickRecorder writer thread:
+    header - magic, number of ticks, payload length and payload CRC32
+    (BLOCK_HEADER)
+    payload - zlib compressed timestamp deltas (ms) and price deltas
+    (int64 bit patterns of float64 prices), both starting from 0
+Consecutive prices share sign and exponent, so their bit patterns
+differ by small integers, which compress well and decode exactly.
+Reading stops at the first incomplete or corrupted block. Torn block
+at the end of segment (crash during write) is cut off before recorder
+appends to the segment again
+"""
+import atexit
+import datetime as dt
+import logging
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BLOCK_HEADER = struct.Struct('<4sIII')
+BLOCK_MAGIC = b'TCK1'
+SEGMENT_EXTENSION = '.ticks'
+
+
+def encode_block(timestamps: np.ndarray, prices: np.ndarray,
+                 compression_level: int = 6) -> bytes:
+    """
+    :param timestamps: int64 milliseconds since epoch
+    :param prices: float64 prices
+    """
+    deltas = np.concatenate([
+        np.diff(timestamps.astype(np.int64), prepend=np.int64(0)),
+        np.diff(prices.astype(np.float64).view(np.int64), prepend=np.int64(0))])
+    payload = zlib.compress(deltas.tobytes(), compression_level)
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, len(timestamps), len(payload),
+                             zlib.crc32(payload)) + payload
+
+
+def _iter_blocks(data: bytes):
+    """ Yields (n_ticks, deltas, block end) of valid blocks, up to the first bad one """
+    position = 0
+    while position + BLOCK_HEADER.size <= len(data):
+        magic, n_ticks, payload_length, crc = BLOCK_HEADER.unpack_from(data, position)
+        payload_start = position + BLOCK_HEADER.size
+        payload = data[payload_start:payload_start + payload_length]
+        if magic != BLOCK_MAGIC or len(payload) != payload_length or zlib.crc32(payload) != crc:
+            return
+        try:
+            deltas = np.frombuffer(zlib.decompress(payload), dtype=np.int64)
+        except zlib.error:
+            return
+        if len(deltas) != 2 * n_ticks:
+            return
+
+        position = payload_start + payload_length
+        yield n_ticks, deltas, position
+
+
+def get_valid_length(data: bytes) -> int:
+    """ Returns length of segment data up to the end of the last valid block """
+    length = 0
+    for _, _, length in _iter_blocks(data):
+        pass
+    return length
+
+
+def decode_blocks(data: bytes) -> tuple:
+    """ Returns (timestamps, prices) of all valid blocks before the first bad one """
+    timestamps = list()
+    prices = list()
+    for n_ticks, deltas, _ in _iter_blocks(data):
+        timestamps.append(np.cumsum(deltas[:n_ticks]))
+        prices.append(np.cumsum(deltas[n_ticks:]).view(np.float64))
+
+    if not timestamps:
+        return np.empty(0, dtype='datetime64[ms]'), np.empty(0, dtype=np.float64)
+    return (np.concatenate(timestamps).view('datetime64[ms]'),
+            np.concatenate(prices))
+
+
+def get_segment_path(directory: str, asset: str, day: dt.date) -> str:
+    return os.path.join(directory, asset, day.isoformat() + SEGMENT_EXTENSION)
+
+
+def read_ticks(directory: str, asset: str, start: dt.date,
+               end: dt.date = None) -> tuple:
+    """
+    Reads ticks of asset recorded from start to end day (both included)
+    :return: (timestamps as datetime64[ms], prices) arrays
+    """
+    if end is None:
+        end = start
+    timestamps = list()
+    prices = list()
+    day = start
+    while day <= end:
+        path = get_segment_path(directory, asset, day)
+        if os.path.exists(path):
+            with open(path, 'rb') as segment:
+                day_timestamps, day_prices = decode_blocks(segment.read())
+            timestamps.append(day_timestamps)
+            prices.append(day_prices)
+        day += dt.timedelta(days=1)
+
+    if not timestamps:
+        return np.empty(0, dtype='datetime64[ms]'), np.empty(0, dtype=np.float64)
+    return np.concatenate(timestamps), np.concatenate(prices)
+
+
+class TickRecorder:
+    """
+    Records polled prices without blocking polling jobs
+    record puts tick to queue (ticks are dropped when queue is full),
+    writer thread appends one compressed block per asset and day every
+    flush_interval seconds. Pending ticks are written at interpreter exit
+    """
+    def __init__(self, directory: str, flush_interval: float = 5.,
+                 max_queue_size: int = 100000):
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._n_dropped = 0
+        self._stop = threading.Event()
+        # Segments checked for torn tail by this recorder
+        self._repaired_segments = set()
+        self._thread = threading.Thread(target=self._run, name='TickRecorder', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def n_dropped(self) -> int:
+        return self._n_dropped
+
+    def record(self, asset: str, price: float, timestamp: dt.datetime = None) -> None:
+        if timestamp is None:
+            timestamp = dt.datetime.now()
+        try:
+            self._queue.put_nowait((asset, timestamp, price))
+        except queue.Full:
+            self._n_dropped += 1
+
+    def close(self) -> None:
+        """ Writes pending ticks and stops writer thread """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        # (asset, day) -> [timestamps, prices]
+        ticks = dict()
+        while True:
+            try:
+                asset, timestamp, price = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            columns = ticks.setdefault((asset, timestamp.date()), (list(), list()))
+            columns[0].append(timestamp)
+            columns[1].append(price)
+
+        for (asset, day), (timestamps, prices) in ticks.items():
+            path = get_segment_path(self._directory, asset, day)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if path not in self._repaired_segments:
+                    self._repair_segment(path)
+                    self._repaired_segments.add(path)
+                block = encode_block(np.array(timestamps, dtype='datetime64[ms]').view(np.int64),
+                                     np.array(prices, dtype=np.float64))
+                with open(path, 'ab') as segment:
+                    segment.write(block)
+                    segment.flush()
+                    os.fsync(segment.fileno())
+            except (OSError, ValueError) as e:
+                logger.error(f'Writing {len(prices)} {asset} ticks to {path} failed: {e}')
+
+    @staticmethod
+    def _repair_segment(path: str) -> None:
+        """ Cuts off torn or corrupted tail, so new blocks follow a valid one """
+        if not os.path.exists(path):
+            return
+        with open(path, 'r+b') as segment:
+            data = segment.read()
+            valid_length = get_valid_length(data)
+            if valid_length < len(data):
+                logger.warning(f'Cutting off {len(data) - valid_length} bytes of '
+                               f'torn block at the end of {path}')
+                segment.truncate(valid_length)
+                os.fsync(segment.fileno())
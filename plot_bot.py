@@ -7,14 +7,16 @@ from databases.mongo.mongo_manager import MongoPricesManager, MongoTransactionsM
 from settings import MONGO_HOST
 
 
-def main(asset: str, n_last: int):
+def main(asset: str, n_last: int, interval: str):
     prices_manager = MongoPricesManager(MONGO_HOST)
     transactions_logger = MongoTransactionsManager(MONGO_HOST)
     indicator_manager = MongoStochasticIndicatorManager(MONGO_HOST)
 
-    prices_df = prices_manager.get_n_last_ohlc(n_last, asset)
+    prices_df = prices_manager.get_n_last_bars(n_last, asset, interval)
     tdf = transactions_logger.get_n_last_transactions(n_last, asset)
-    indicators = indicator_manager.get_n_last_indicators(n_last, asset)
+    # Resolution of indicators is chosen for the plotted range
+    indicators = indicator_manager.get_indicators_between(
+        asset, prices_df.index[0].to_pydatetime(), prices_df.index[-1].to_pydatetime())
 
     longs = tdf.loc[tdf['Comment'] == 'Long', :]
     closing_longs = tdf.loc[tdf['Comment'] == 'Closing Long', :]
@@ -70,5 +72,6 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--asset', type=str, help='Asset', required=True)
     parser.add_argument('--n_last', type=int, help='n last OHLC prices to plot', default=1000)
+    parser.add_argument('--interval', type=str, help='OHLC interval, for example 1T, 1H', default='1T')
     args = parser.parse_args()
-    main(args.asset, args.n_last)
+    main(args.asset, args.n_last, args.interval)
@@ -1,4 +1,5 @@
 import abc
+import time
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.common.by import By
@@ -10,12 +11,27 @@ from selenium.common.exceptions import (InvalidSessionIdException,
                                         NoSuchWindowException,
                                         StaleElementReferenceException)
 import settings
+from price_api.price_observer import drain_price_ticks
+
+
+def create_firefox_driver() -> webdriver.Firefox:
+    """ Headless Firefox webdriver """
+    options = Options()
+    options.set_preference('dom.webnotifications.enabled', False)
+    options.headless = True
+
+    if settings.ENVIRONMENT == 'MACOS':
+        return webdriver.Firefox(options=options)
+    return webdriver.Firefox(executable_path='./geckodriver', options=options)
 
 
 class PriceAPI(abc.ABC):
     """ Price Api interface """
     __slots__ = ('_asset', 'is_ready')
 
+    # Pooled APIs are created by their pool, not by PriceAPIFactory
+    is_pooled = False
+
     @property
     @abc.abstractmethod
     def PriceAPIExceptions(self):
@@ -34,6 +50,15 @@ class PriceAPI(abc.ABC):
     def get_price(self) -> float:
         pass
 
+    def get_ticks(self) -> list:
+        """
+        Returns (timestamp, price) of price changes since the last call
+        By default it is the current price only - APIs pushing every
+        change override it
+        """
+        price = self.get_price()
+        return [(time.time(), price)] if price else list()
+
     @abc.abstractmethod
     def close(self):
         pass
@@ -74,6 +99,12 @@ class TradingViewAPI(PriceAPI):
         if self.is_ready and self._price_element.text:
             return float(self._price_element.text)
 
+    def get_ticks(self) -> list:
+        """ Drains every price change observed in page since the last call """
+        if self.is_ready:
+            return drain_price_ticks(self._driver, self.price_xpath)
+        return list()
+
     def close(self):
         if self._driver.service.process:
             self._driver.quit()
@@ -85,16 +116,7 @@ class TradingViewAPI(PriceAPI):
 
     def _set_driver(self):
         """ Set Firefox webdriver """
-        options = Options()
-        options.set_preference('dom.webnotifications.enabled', False)
-        options.headless = True
-
-        if settings.ENVIRONMENT == 'MACOS':
-            driver = webdriver.Firefox(options=options)
-        else:
-            driver = webdriver.Firefox(
-                executable_path='./geckodriver', options=options)
-        self._driver = driver
+        self._driver = create_firefox_driver()
 
     def _set_price_element(self):
         """ Set price element to read """
@@ -117,6 +139,8 @@ class PriceAPIFactory:
     def get_price_api(asset: str) -> PriceAPI:
         """ Returns Price API object, that had succesfully set price element """
         for APIClass in PriceAPI.__subclasses__():
+            if APIClass.is_pooled:
+                continue
             price_api = APIClass(asset)
             price_api.init()
 
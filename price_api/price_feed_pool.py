@@ -0,0 +1,240 @@
+"""
+Pool of pre-launched headless browsers reading prices of many assets
+
+Launching Firefox and loading price page takes seconds, so sessions are
+opened ahead of time. Assets are split into groups sharing one browser
+(one tab per asset) and every group has hot standby sessions with the
+same tabs loaded. Failed session is replaced by a standby at once and
+relaunched in background thread as a new standby
+"""
+import atexit
+import collections
+import logging
+import threading
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
+
+from price_api.price_api import PriceAPI, TradingViewAPI, create_firefox_driver
+from price_api.price_observer import drain_price_ticks
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserSession:
+    """
+    Headless browser with pre-loaded price page of every asset in own tab
+    WebDriver reads elements of the current tab only, so reads switch
+    tabs - sequentially, under lock
+    """
+    __slots__ = ('_assets', '_driver', '_tabs', '_price_elements', '_current_tab', '_lock')
+
+    def __init__(self, assets: tuple):
+        self._assets = assets
+        self._driver = None
+        # asset -> window handle
+        self._tabs = dict()
+        self._price_elements = dict()
+        self._current_tab = None
+        self._lock = threading.Lock()
+
+    @property
+    def assets(self) -> tuple:
+        return self._assets
+
+    def open(self, page_load_timeout: float = 15.) -> None:
+        """ Launches browser and loads price pages, raises when any of them fails """
+        driver = create_firefox_driver()
+        try:
+            for asset in self._assets:
+                if self._tabs:
+                    known_tabs = set(driver.window_handles)
+                    driver.execute_script('window.open("about:blank", "_blank");')
+                    driver.switch_to.window(next(
+                        tab for tab in driver.window_handles if tab not in known_tabs))
+                driver.get(TradingViewAPI.price_url + asset)
+                WebDriverWait(driver, page_load_timeout).until(
+                    EC.presence_of_element_located((By.XPATH, TradingViewAPI.price_xpath)))
+                self._tabs[asset] = driver.current_window_handle
+                self._price_elements[asset] = driver.find_element(
+                    By.XPATH, TradingViewAPI.price_xpath)
+        except Exception:
+            self._quit(driver)
+            raise
+        self._driver = driver
+        self._current_tab = driver.current_window_handle
+
+    def get_price(self, asset: str) -> float:
+        with self._lock:
+            self._switch_tab(asset)
+            text = self._price_elements[asset].text
+        if text:
+            return float(text)
+
+    def get_ticks(self, asset: str) -> list:
+        with self._lock:
+            self._switch_tab(asset)
+            return drain_price_ticks(self._driver, TradingViewAPI.price_xpath)
+
+    def _switch_tab(self, asset: str) -> None:
+        tab = self._tabs[asset]
+        if tab != self._current_tab:
+            self._driver.switch_to.window(tab)
+            self._current_tab = tab
+
+    def close(self) -> None:
+        with self._lock:
+            if self._driver is not None:
+                self._quit(self._driver)
+                self._driver = None
+
+    @staticmethod
+    def _quit(driver) -> None:
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            logger.warning(f'Closing browser failed: {e}')
+
+
+class PriceFeedPool:
+    """
+    Browser sessions of all assets - the first session of every group is
+    active, the rest are hot standbys. Sessions failed by price APIs are
+    dropped and relaunched in background until the pool is closed
+    """
+    def __init__(self, assets: list, assets_per_browser: int = 3, n_standby: int = 1,
+                 page_load_timeout: float = 15., relaunch_delay: float = 5.):
+        """
+        :param assets_per_browser: number of assets sharing one browser (tabs)
+        :param n_standby: number of standby sessions kept for every group
+        :param relaunch_delay: seconds between failed launches of a session
+        """
+        self._groups = [tuple(assets[i:i + assets_per_browser])
+                        for i in range(0, len(assets), assets_per_browser)]
+        self._group_of_asset = {asset: group for group in self._groups for asset in group}
+        self._n_standby = n_standby
+        self._page_load_timeout = page_load_timeout
+        self._relaunch_delay = relaunch_delay
+        # group -> sessions, active first
+        self._sessions = {group: collections.deque() for group in self._groups}
+        self._lock = threading.Lock()
+        self._session_ready = threading.Condition(self._lock)
+        self._closed = threading.Event()
+        self._is_started = False
+
+    def start(self, timeout: float = 120.) -> None:
+        """ Launches all sessions at once, blocks until every group has an active one """
+        with self._lock:
+            if self._is_started:
+                return
+            self._is_started = True
+        atexit.register(self.close)
+
+        for group in self._groups:
+            for _ in range(1 + self._n_standby):
+                self._launch_in_background(group)
+
+        with self._session_ready:
+            is_ready = self._session_ready.wait_for(
+                lambda: all(self._sessions.values()), timeout)
+        if not is_ready:
+            raise ConnectionError('Browser sessions were not launched in time! '
+                                  'Check internet connection!')
+
+    def get_price_api(self, asset: str) -> 'PooledPriceAPI':
+        if asset not in self._group_of_asset:
+            raise ValueError(f'\'{asset}\' is not an asset of this pool!')
+        return PooledPriceAPI(asset, self)
+
+    def get_session(self, asset: str) -> BrowserSession:
+        """ Returns active session reading asset price """
+        with self._lock:
+            sessions = self._sessions[self._group_of_asset[asset]]
+            if not sessions:
+                raise ConnectionError(f'No browser session of \'{asset}\' is ready')
+            return sessions[0]
+
+    def fail_over(self, session: BrowserSession) -> None:
+        """
+        Replaces failed session with the next standby and relaunches it
+        Does nothing if session was already replaced
+        """
+        with self._lock:
+            sessions = self._sessions[session.assets]
+            if session not in sessions:
+                return
+            sessions.remove(session)
+            n_ready = len(sessions)
+        logger.warning(f'Browser session of {", ".join(session.assets)} failed, '
+                       f'{n_ready} ready sessions left')
+        threading.Thread(target=session.close, name='PriceFeedPoolClose', daemon=True).start()
+        self._launch_in_background(session.assets)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            sessions = [session for group_sessions in self._sessions.values()
+                        for session in group_sessions]
+            for group_sessions in self._sessions.values():
+                group_sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _launch_in_background(self, group: tuple) -> None:
+        threading.Thread(target=self._launch, args=(group,),
+                         name='PriceFeedPoolLaunch', daemon=True).start()
+
+    def _launch(self, group: tuple) -> None:
+        while not self._closed.is_set():
+            session = BrowserSession(group)
+            try:
+                session.open(self._page_load_timeout)
+            except Exception as e:
+                logger.error(f'Launching browser session of {", ".join(group)} failed: {e}')
+                self._closed.wait(self._relaunch_delay)
+                continue
+
+            with self._session_ready:
+                if not self._closed.is_set():
+                    self._sessions[group].append(session)
+                    self._session_ready.notify_all()
+                    return
+            session.close()
+
+
+class PooledPriceAPI(PriceAPI):
+    """ Price API of one asset reading from PriceFeedPool sessions """
+    __slots__ = ('_pool', '_session')
+
+    PriceAPIExceptions = TradingViewAPI.PriceAPIExceptions + (ConnectionError,)
+    is_pooled = True
+
+    def __init__(self, asset: str, pool: PriceFeedPool):
+        super().__init__(asset)
+        self._pool = pool
+        # Session of the last read, failed over on restart
+        self._session: BrowserSession = None
+        self.is_ready = True
+
+    def init(self):
+        self._pool.start()
+
+    def get_price(self) -> float:
+        self._session = self._pool.get_session(self._asset)
+        return self._session.get_price(self._asset)
+
+    def get_ticks(self) -> list:
+        self._session = self._pool.get_session(self._asset)
+        return self._session.get_ticks(self._asset)
+
+    def close(self):
+        """ Sessions are owned by pool """
+        pass
+
+    def restart(self):
+        """ Switches to standby session in milliseconds, failed one is relaunched in background """
+        if self._session is not None:
+            self._pool.fail_over(self._session)
+            self._session = None
@@ -0,0 +1,82 @@
+"""
+Push based price reading - MutationObserver injected into price page
+
+Observer records [timestamp ms, text] of every change of price element
+to in-page buffer, which is drained by a single execute_script call.
+Buffer is kept per page, so every tab of a browser has its own. When the
+page replaces price element (or reloads), drain returns null and the
+observer is installed again on the new element
+"""
+import logging
+
+from selenium.common.exceptions import StaleElementReferenceException
+
+logger = logging.getLogger(__name__)
+
+# Ticks kept in page between drains, the oldest are dropped
+MAX_BUFFERED_TICKS = 10000
+
+INSTALL_OBSERVER_SCRIPT = """
+var xpath = arguments[0], maxTicks = arguments[1];
+if (window.__traiPriceObserver) {
+    if (document.contains(window.__traiPriceElement)) {
+        return true;
+    }
+    window.__traiPriceObserver.disconnect();
+    window.__traiPriceObserver = null;
+}
+var element = document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!element) {
+    return false;
+}
+var lastText = null;
+var record = function () {
+    var text = element.textContent.trim();
+    if (text && text !== lastText) {
+        lastText = text;
+        var ticks = window.__traiPriceTicks;
+        ticks.push([Date.now(), text]);
+        if (ticks.length > maxTicks) {
+            ticks.shift();
+        }
+    }
+};
+window.__traiPriceTicks = [];
+window.__traiPriceElement = element;
+window.__traiPriceObserver = new MutationObserver(record);
+window.__traiPriceObserver.observe(element, {childList: true, characterData: true, subtree: true});
+record();
+return true;
+"""
+
+DRAIN_TICKS_SCRIPT = """
+if (!window.__traiPriceObserver || !document.contains(window.__traiPriceElement)) {
+    return null;
+}
+var ticks = window.__traiPriceTicks;
+window.__traiPriceTicks = [];
+return ticks;
+"""
+
+
+def drain_price_ticks(driver, price_xpath: str) -> list:
+    """
+    Returns (timestamp, price) of price changes since the last drain in
+    current tab, timestamp in seconds since epoch. Installs observer first
+    """
+    ticks = driver.execute_script(DRAIN_TICKS_SCRIPT)
+    if ticks is None:
+        if not driver.execute_script(INSTALL_OBSERVER_SCRIPT, price_xpath, MAX_BUFFERED_TICKS):
+            raise StaleElementReferenceException('Price element is not on the page')
+        ticks = driver.execute_script(DRAIN_TICKS_SCRIPT) or list()
+
+    # Buffer is already cleared - text which is not a price is skipped,
+    # so it does not lose the rest of ticks
+    prices = list()
+    for timestamp, text in ticks:
+        try:
+            prices.append((timestamp / 1000, float(text)))
+        except ValueError:
+            logger.warning(f'Skipped price tick \'{text}\', it is not a number')
+    return prices
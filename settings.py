@@ -6,3 +6,8 @@ if ENVIRONMENT == 'MACOS':
     MONGO_HOST = 'mongodb://localhost:27017/'
 else:
     MONGO_HOST = 'mongodb://db:27017/'
+
+# 'mongo' or 'sqlite' - embedded database file, no database service needed
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'mongo')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'trai.db')
+TICKS_DIRECTORY = os.environ.get('TICKS_DIRECTORY', 'ticks')
@@ -0,0 +1,163 @@
+"""
+Streaming bars built from ticks in constant memory
+
+Every tick updates open / high / low / close, ticks count and VWAP of
+the current bar of each interval in place, so closing a bar costs
+nothing and nothing is buffered between rollovers
+"""
+import datetime as dt
+
+from databases.ohlc import OHLC, Color
+
+
+class Bar:
+    """ Bar updated in place with every tick """
+    __slots__ = ('start', 'interval', 'open', 'high', 'low', 'close',
+                 'n_ticks', 'volume', '_turnover')
+
+    def __init__(self, start: float, interval: float, price: float, volume: float = 1.):
+        """
+        :param start: seconds since epoch
+        :param interval: bar length in seconds
+        """
+        self.start = start
+        self.interval = interval
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.n_ticks = 1
+        self.volume = volume
+        self._turnover = price * volume
+
+    @property
+    def end(self) -> float:
+        return self.start + self.interval
+
+    @property
+    def vwap(self) -> float:
+        """ Volume weighted average price, ticks are weighted equally without volume """
+        return self._turnover / self.volume if self.volume else self.close
+
+    def add_tick(self, price: float, volume: float = 1.) -> None:
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.n_ticks += 1
+        self.volume += volume
+        self._turnover += price * volume
+
+    def to_ohlc(self, print_color: str = Color.GREEN) -> OHLC:
+        return OHLC(timestamp=dt.datetime.fromtimestamp(self.start).strftime('%Y-%m-%d %H:%M:%S'),
+                    open=self.open, high=self.high, low=self.low, close=self.close,
+                    print_color=print_color)
+
+
+class BarBuilder:
+    """
+    Builds bars of one asset in several intervals at once
+    Finished bars are passed to on_bar(interval, bar) - when the first
+    tick of the next bar arrives or when close_bars is called at the bar
+    end, whichever comes first. Ticks of already finished bars are dropped.
+    With carry_forward, bars without ticks are finished as flat bars at
+    the last close (price did not change), so no bar is missing
+    """
+    __slots__ = ('_intervals', '_on_bar', '_carry_forward', '_bars', '_closed_until',
+                 '_last_close')
+
+    def __init__(self, intervals: tuple = (60.,), on_bar=None, carry_forward: bool = False):
+        """
+        :param intervals: bar lengths in seconds
+        :param on_bar: callable(interval, bar) receiving finished bars
+        :param carry_forward: finish bars without ticks at the last close
+        """
+        self._intervals = tuple(intervals)
+        self._on_bar = on_bar
+        self._carry_forward = carry_forward
+        # interval -> current bar
+        self._bars = dict.fromkeys(self._intervals)
+        # interval -> end of the last finished bar
+        self._closed_until = dict.fromkeys(self._intervals, float('-inf'))
+        # interval -> close of the last finished bar
+        self._last_close = dict.fromkeys(self._intervals)
+
+    @property
+    def intervals(self) -> tuple:
+        return self._intervals
+
+    def get_current_bar(self, interval: float) -> Bar:
+        """ Returns unfinished bar of interval or None """
+        return self._bars[interval]
+
+    def add_tick(self, timestamp: float, price: float, volume: float = 1.) -> bool:
+        """
+        :param timestamp: seconds since epoch
+        :return: False if tick was dropped for every interval (its bars were finished)
+        """
+        is_added = False
+        for interval in self._intervals:
+            if timestamp < self._closed_until[interval]:
+                continue
+
+            bar = self._bars[interval]
+            if bar is not None and timestamp >= bar.end:
+                self._finish(interval, bar)
+                bar = None
+
+            if bar is None:
+                bar_start = timestamp // interval * interval
+                self._carry_close_forward(interval, bar_start)
+                self._bars[interval] = Bar(bar_start, interval, price, volume)
+            else:
+                bar.add_tick(price, volume)
+            is_added = True
+        return is_added
+
+    def close_bars(self, timestamp: float) -> list:
+        """
+        Finishes bars which end at or before timestamp
+        :return: list of (interval, bar) finished by this call
+        """
+        finished = list()
+        for interval in self._intervals:
+            bar = self._bars[interval]
+            if bar is not None and bar.end <= timestamp:
+                self._finish(interval, bar)
+                finished.append((interval, bar))
+                bar = None
+
+            until = timestamp // interval * interval
+            if bar is not None:
+                until = min(until, bar.start)
+            finished.extend((interval, flat_bar) for flat_bar
+                            in self._carry_close_forward(interval, until))
+            self._closed_until[interval] = max(self._closed_until[interval],
+                                               timestamp // interval * interval)
+        return finished
+
+    def reset_last_close(self) -> None:
+        """ Stops carrying close forward until the next bar with ticks is finished """
+        self._last_close = dict.fromkeys(self._intervals)
+
+    def _carry_close_forward(self, interval: float, until: float) -> list:
+        """ Finishes flat bars from the end of the last finished bar until timestamp """
+        flat_bars = list()
+        if not self._carry_forward or self._last_close[interval] is None:
+            return flat_bars
+        while self._closed_until[interval] + interval <= until:
+            flat_bar = Bar(self._closed_until[interval], interval,
+                           self._last_close[interval], volume=0.)
+            flat_bar.n_ticks = 0
+            self._finish(interval, flat_bar)
+            flat_bars.append(flat_bar)
+        return flat_bars
+
+    def _finish(self, interval: float, bar: Bar) -> None:
+        if self._bars[interval] is bar:
+            self._bars[interval] = None
+        self._closed_until[interval] = bar.end
+        self._last_close[interval] = bar.close
+        if self._on_bar is not None:
+            self._on_bar(interval, bar)
@@ -0,0 +1,77 @@
+"""
+Wall clock aligned bar boundaries, free of polling drift
+
+BarScheduler keeps its own clock - monotonic time anchored to wall time,
+so sleeping and measuring are not affected by system clock steps, yet
+boundaries fall on wall clock minutes. Clock is re-anchored when it
+drifts from wall time by more than max_drift seconds (NTP correction).
+"""
+import asyncio
+import datetime as dt
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BarScheduler:
+    """
+    Computes bar boundaries and closes bars at exact deadlines
+    Every tick belongs to the bar containing its timestamp. Bar is closed
+    grace seconds after its end, so ticks read just before the boundary
+    still arrive. Closes are never skipped - when the loop wakes up late,
+    all passed bars are closed one after another
+    """
+    __slots__ = ('_interval', '_grace', '_max_drift', '_wall_anchor',
+                 '_monotonic_anchor', '_next_bar_end')
+
+    def __init__(self, interval: float = 60., grace: float = 0.25, max_drift: float = 0.5):
+        """
+        :param interval: bar length in seconds
+        :param grace: seconds after bar end to wait for late ticks
+        :param max_drift: seconds of difference to wall time that re-anchors the clock
+        """
+        self._interval = interval
+        self._grace = grace
+        self._max_drift = max_drift
+        self._anchor()
+        self._next_bar_end = self.get_bar_start(self.now()) + interval
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def _anchor(self) -> None:
+        self._wall_anchor = time.time()
+        self._monotonic_anchor = time.monotonic()
+
+    def now(self) -> float:
+        """ Wall time (seconds since epoch) measured with monotonic clock """
+        return self._wall_anchor + time.monotonic() - self._monotonic_anchor
+
+    def get_bar_start(self, timestamp: float) -> float:
+        return timestamp // self._interval * self._interval
+
+    @staticmethod
+    def to_datetime(timestamp: float) -> dt.datetime:
+        return dt.datetime.fromtimestamp(timestamp)
+
+    def _correct_drift(self) -> None:
+        drift = self.now() - time.time()
+        if abs(drift) > self._max_drift:
+            logger.warning(f'Bar scheduler clock drifted {drift:.3f} s from wall time, re-anchoring')
+            self._anchor()
+
+    async def wait_for_bar_close(self) -> float:
+        """
+        Sleeps until the next bar close deadline
+        :return: start (seconds since epoch) of the closed bar
+        """
+        await asyncio.sleep(max(self._next_bar_end + self._grace - self.now(), 0))
+        bar_start = self._next_bar_end - self._interval
+        self._next_bar_end += self._interval
+        lateness = self.now() - bar_start - self._interval - self._grace
+        if lateness > self._interval:
+            logger.warning(f'Bar {self.to_datetime(bar_start)} closed {lateness:.3f} s late')
+        self._correct_drift()
+        return bar_start
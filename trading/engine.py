@@ -0,0 +1,237 @@
+import asyncio
+import concurrent.futures
+import datetime as dt
+import functools
+import logging
+
+from databases.indicators_manager import StochasticIndicatorManager
+from databases.ohlc import OHLC, Color
+from databases.prices_manager import PricesManager
+from databases.ticks.tick_recorder import TickRecorder
+from databases.transactions_manager import TransactionsManager
+from price_api import price_api
+from price_api.price_feed_pool import PriceFeedPool
+from .bar_builder import Bar, BarBuilder
+from .bar_scheduler import BarScheduler
+from .broker_api import BrokerAPI
+from .trading_bot import TradingBot
+
+logger = logging.getLogger(__name__)
+
+
+class AssetConfig:
+    """ Asset traded by TradingEngine and its live strategy """
+    __slots__ = ('asset', 'Strategy', 'strategy_params', 'print_color')
+
+    def __init__(self, asset: str, Strategy, strategy_params: dict,
+                 print_color: str = Color.GREEN):
+        """
+        :param Strategy: live strategy class, for example StochasticOscillatorStrategy
+        :param strategy_params: strategy init params without asset and managers
+        """
+        self.asset = asset
+        self.Strategy = Strategy
+        self.strategy_params = strategy_params
+        self.print_color = print_color
+
+
+class AssetState:
+    """ Live state of single asset task """
+    __slots__ = ('config', 'price_api', 'strategy', 'bot', 'position',
+                 'bar_builder', 'last_bar_start', 'n_times_restarted', 'rollover')
+
+    def __init__(self, config: AssetConfig, strategy, bot: TradingBot, position: int):
+        self.config = config
+        self.price_api: price_api.PriceAPI = None
+        self.strategy = strategy
+        self.bot = bot
+        self.position = position
+        self.bar_builder: BarBuilder = None
+        # Start of the last finished minute bar
+        self.last_bar_start: float = None
+        self.n_times_restarted = 0
+        # Minute rollover in progress - the next one waits for it
+        self.rollover: asyncio.Future = None
+
+
+class TradingEngine:
+    """
+    Runs every asset as a lightweight task on a single asyncio event loop
+    Asset task polls price every price_read_interval (deadline scheduled,
+    so polling does not drift) and adds every price to the streaming bar
+    of its timestamp. Bars are finished by the first price of the next
+    bar or by BarScheduler at exact deadlines, whichever comes first -
+    minute OHLC is inserted, passed to strategy and the bot takes action.
+    Blocking calls (price APIs, databases, broker) run in a bounded
+    thread pool, shared by all assets
+    """
+    def __init__(self, asset_configs: list, prices_manager: PricesManager,
+                 transactions_manager: TransactionsManager,
+                 indicator_manager: StochasticIndicatorManager, broker_api: BrokerAPI,
+                 tick_recorder: TickRecorder = None, price_read_interval: float = 0.1,
+                 max_retries: int = 3, max_workers: int = 8,
+                 bar_scheduler: BarScheduler = None, price_feed_pool: PriceFeedPool = None,
+                 push_prices: bool = False):
+        """
+        :param price_read_interval: seconds between price reads
+        :param max_retries: price API restarts after which asset is
+        paused until reset_retries
+        :param max_workers: size of thread pool for blocking calls
+        :param bar_scheduler: minute bars scheduler, created by default
+        :param price_feed_pool: pool of pre-launched browsers reading prices,
+        otherwise every asset gets its own price API from PriceAPIFactory
+        :param push_prices: every price_read_interval drain all price changes
+        recorded in page (with their timestamps) instead of reading the current price
+        """
+        self._prices_manager = prices_manager
+        self._transactions_manager = transactions_manager
+        self._tick_recorder = tick_recorder
+        self._price_read_interval = price_read_interval
+        self._max_retries = max_retries
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='TradingEngine')
+        self._periodic_jobs = list()
+        self._last_printed_minute = None
+        self._bar_scheduler = bar_scheduler or BarScheduler(60.)
+        self._price_feed_pool = price_feed_pool
+        self._push_prices = push_prices
+
+        self._states = list()
+        for config in asset_configs:
+            strategy = config.Strategy(
+                asset=config.asset, prices_manager=prices_manager,
+                indicator_manager=indicator_manager, **config.strategy_params)
+            bot = TradingBot(strategy_object=strategy, broker_api_object=broker_api,
+                             transactions_manager=transactions_manager)
+            position = transactions_manager.get_current_position(config.asset)
+            state = AssetState(config, strategy, bot, position)
+            # Pushed prices change only with the quote - minute without change
+            # is a flat bar at the last close, as it would be when polling
+            state.bar_builder = BarBuilder((self._bar_scheduler.interval,),
+                                           on_bar=functools.partial(self._on_bar, state),
+                                           carry_forward=push_prices)
+            self._states.append(state)
+
+    @property
+    def assets(self) -> list:
+        return [state.config.asset for state in self._states]
+
+    def add_periodic_job(self, interval: dt.timedelta, job) -> None:
+        """ Registers blocking function run in thread pool every interval """
+        self._periodic_jobs.append((interval.total_seconds(), job))
+
+    def reset_retries(self) -> None:
+        """ Resumes price polling of assets paused after max_retries restarts """
+        for state in self._states:
+            state.n_times_restarted = 0
+
+    async def _run_blocking(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    async def run(self) -> None:
+        if self._price_feed_pool is not None:
+            await self._run_blocking(self._price_feed_pool.start)
+            for state in self._states:
+                state.price_api = self._price_feed_pool.get_price_api(state.config.asset)
+        else:
+            price_apis = await asyncio.gather(*[
+                self._run_blocking(price_api.PriceAPIFactory.get_price_api, state.config.asset)
+                for state in self._states])
+            for state, asset_price_api in zip(self._states, price_apis):
+                state.price_api = asset_price_api
+
+        await asyncio.gather(
+            *[self._run_asset(state) for state in self._states],
+            self._run_bar_closer(),
+            *[self._run_periodic_job(interval, job) for interval, job in self._periodic_jobs])
+
+    async def _run_periodic_job(self, interval: float, job) -> None:
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
+        while True:
+            deadline += interval
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+            try:
+                await self._run_blocking(job)
+            except Exception as e:
+                logger.error(f'{job.__name__} error: {e}')
+
+    async def _run_asset(self, state: AssetState) -> None:
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
+        while True:
+            if state.n_times_restarted < self._max_retries:
+                await self._read_price(state)
+
+            deadline += self._price_read_interval
+            if deadline < loop.time():
+                # Event loop was blocked - skip missed reads
+                deadline = loop.time() + self._price_read_interval
+            await asyncio.sleep(deadline - loop.time())
+
+    async def _run_bar_closer(self) -> None:
+        while True:
+            bar_start = await self._bar_scheduler.wait_for_bar_close()
+            for state in self._states:
+                state.bar_builder.close_bars(bar_start + self._bar_scheduler.interval)
+                if state.last_bar_start != bar_start and \
+                        state.n_times_restarted < self._max_retries:
+                    logger.warning(f'{state.config.asset} - no prices read in minute '
+                                   f'{self._bar_scheduler.to_datetime(bar_start)}')
+
+    def _on_bar(self, state: AssetState, interval: float, bar: Bar) -> None:
+        state.last_bar_start = bar.start
+        state.rollover = asyncio.ensure_future(self._roll_minute_over(
+            state, bar.to_ohlc(state.config.print_color), state.rollover))
+
+    async def _read_price(self, state: AssetState) -> None:
+        asset = state.config.asset
+        try:
+            if self._push_prices:
+                ticks = await self._run_blocking(state.price_api.get_ticks)
+            else:
+                price = await self._run_blocking(state.price_api.get_price)
+                # Price is stamped when read completes, bar close waits grace for it
+                ticks = [(self._bar_scheduler.now(), price)] if price else list()
+        except Exception as e:
+            logger.error(f'{asset} price api error: {e}\nRestarting...')
+            state.n_times_restarted += 1
+            try:
+                await self._run_blocking(state.price_api.restart)
+            except Exception as e:
+                logger.error(f'{asset} price api restart error: {e}')
+            if state.n_times_restarted >= self._max_retries:
+                logger.error(f'{asset} paused after {self._max_retries} restarts')
+                # Paused asset has no price - it must not be carried forward
+                state.bar_builder.reset_last_close()
+        else:
+            for timestamp, price in ticks:
+                if not state.bar_builder.add_tick(timestamp, price):
+                    logger.debug(f'{asset} price {price} read after its bar was closed')
+                if self._tick_recorder is not None:
+                    self._tick_recorder.record(asset, price,
+                                               self._bar_scheduler.to_datetime(timestamp))
+            state.n_times_restarted = 0
+
+    async def _roll_minute_over(self, state: AssetState, ohlc: OHLC,
+                                previous_rollover: asyncio.Future) -> None:
+        """ Inserts minute OHLC and takes action, after previous minute is done """
+        if previous_rollover is not None and not previous_rollover.done():
+            await asyncio.wait([previous_rollover])
+
+        asset = state.config.asset
+        try:
+            await self._run_blocking(self._prices_manager.insert_ohlc, ohlc, asset)
+            state.strategy.add_ohlc(ohlc)
+            self._print_ohlc(ohlc, asset)
+            state.position = await self._run_blocking(state.bot.take_action, state.position)
+        except Exception as e:
+            logger.error(f'{asset} minute rollover error: {e}')
+
+    def _print_ohlc(self, ohlc: OHLC, asset: str) -> None:
+        now = dt.datetime.now()
+        minute = now.replace(second=0, microsecond=0)
+        if minute != self._last_printed_minute:
+            self._last_printed_minute = minute
+            logger.info(f'{Color.UNDERLINE}{now.strftime("%Y-%m-%d %H:%M:%S")}{Color.END} :')
+        logger.info(f'{asset} inserted: {ohlc}')
@@ -1,27 +1,39 @@
 import abc
-import pandas as pd
+import datetime as dt
 
+from databases.bar_aggregator import interval_minutes
 from databases.indicators_manager import StochasticIndicatorManager, IndicatorManager
+from databases.ohlc import OHLC
 from databases.prices_manager import PricesManager
 from trading_indicators import technical_indicators
-from data_preprocessing import market_data_preprocessing
 
 
-n_minutes_dict = {
-    '1T': 1,
-    '5T': 5,
-    '15T': 15,
-    '30T': 30,
-    '1H': 60
-}
+def to_datetime(timestamp) -> dt.datetime:
+    """ Converts OHLC timestamp ('%Y-%m-%d %H:%M:%S' string) to datetime """
+    if isinstance(timestamp, str):
+        return dt.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    return timestamp
+
+
+def is_interval_start(timestamp: dt.datetime, n_minutes: int) -> bool:
+    """
+    Checks if 1 minute bar opens the interval - the same bars are taken
+    by prepare_market_df resampling
+    """
+    return (timestamp.hour * 60 + timestamp.minute) % n_minutes == 0
 
 
 class IndicatorReader(abc.ABC):
-    """ Technical Indicator live monitor abstract class """
+    """
+    Technical Indicator live monitor abstract class
+    Indicators are warmed up from database once, then every new OHLC
+    received from live loop (add_ohlc) updates them incrementally
+    """
     __slots__ = ('_asset', '_enter_interval', '_exit_interval',
                  '_num_of_enter_m1', '_num_of_exit_m1', '_necessary_num_of_m1',
-                 '_price_reader', '_n_ohlc_to_download', '_enter_df',
-                 '_exit_df', '_are_indicators_calculated')
+                 '_price_reader', '_indicator_manager', '_n_ohlc_to_download',
+                 '_pending_ohlc', '_last_timestamp', '_hour',
+                 '_is_warmed_up', '_are_indicators_calculated')
 
     def __init__(self, asset: str, enter_interval: str, exit_interval: str,
                  prices_manager: PricesManager, indicator_manager: IndicatorManager):
@@ -31,19 +43,21 @@ class IndicatorReader(abc.ABC):
         self._price_reader = prices_manager
         self._indicator_manager = indicator_manager
 
-        self._num_of_enter_m1: int = n_minutes_dict[self._enter_interval]
-        self._num_of_exit_m1: int = n_minutes_dict[self._exit_interval]
+        self._num_of_enter_m1: int = interval_minutes[self._enter_interval]
+        self._num_of_exit_m1: int = interval_minutes[self._exit_interval]
         self._necessary_num_of_m1: int = max(self._num_of_enter_m1,
                                              self._num_of_exit_m1)
 
         self._n_ohlc_to_download: int = self._get_n_ohlc_to_download()
-        self._enter_df = pd.DataFrame()
-        self._exit_df = pd.DataFrame()
+        self._pending_ohlc = list()
+        self._last_timestamp: dt.datetime = None
+        self._hour: int = None
+        self._is_warmed_up = False
         self._are_indicators_calculated = False
 
     @property
     def hour(self) -> int:
-        return self._enter_df['Hour'].iat[-1]
+        return self._hour
 
     @property
     def are_indicators_calculated(self) -> bool:
@@ -57,29 +71,81 @@ class IndicatorReader(abc.ABC):
         """
         pass
 
+    @abc.abstractmethod
+    def _reset_indicators(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def _update_indicators_with_bar(self, timestamp: dt.datetime,
+                                    high: float, low: float,
+                                    close: float) -> None:
+        """ Updates indicators state with single 1 minute bar """
+        pass
+
     @abc.abstractmethod
     def update_indicators(self):
         pass
 
-    def _market_data_updated(self) -> bool:
+    def add_ohlc(self, ohlc: OHLC) -> None:
+        """
+        Receives new 1 minute OHLC directly from live loop
+        It is consumed by the next update_indicators call
         """
-        Checks if ohlc received from price reader is long enough
-        to calculate necessary market dataframes
+        self._pending_ohlc.append(ohlc)
+
+    def _add_bar(self, timestamp: dt.datetime, high: float,
+                 low: float, close: float) -> None:
+        self._update_indicators_with_bar(timestamp, high, low, close)
+        self._last_timestamp = timestamp
+
+    def _warm_up(self) -> bool:
         """
+        Downloads last ohlc from price reader and feeds them to indicators
+        Returns False when there is not enough data to calculate them
+        """
+        del self._pending_ohlc[:]
+        self._reset_indicators()
+        self._last_timestamp = None
+        self._hour = None
+
         market_data = self._price_reader.get_n_last_ohlc(self._n_ohlc_to_download, self._asset)
         if len(market_data) < self._n_ohlc_to_download:
+            self._is_warmed_up = False
             return False
 
-        self._enter_df = market_data_preprocessing.prepare_market_df(
-            market_data=market_data, interval=self._enter_interval)
-        self._exit_df = market_data_preprocessing.prepare_market_df(
-            market_data=market_data, interval=self._exit_interval)
+        for timestamp, high, low, close in zip(
+                market_data.index, market_data['High'].values,
+                market_data['Low'].values, market_data['Close'].values):
+            self._add_bar(timestamp.to_pydatetime(), high, low, close)
+
+        self._is_warmed_up = True
+        return True
+
+    def _market_data_updated(self) -> bool:
+        """
+        Feeds pending ohlc to indicators
+        Falls back to database warm up on cold start or when gap
+        between received ohlc is detected
+        """
+        if not self._is_warmed_up:
+            return self._warm_up()
+
+        for ohlc in self._pending_ohlc:
+            timestamp = to_datetime(ohlc.timestamp)
+            if timestamp <= self._last_timestamp:
+                continue
+            if timestamp - self._last_timestamp != dt.timedelta(minutes=1):
+                return self._warm_up()
+            self._add_bar(timestamp, ohlc.high, ohlc.low, ohlc.close)
+
+        del self._pending_ohlc[:]
         return True
 
 
 class StochasticOscillatorReader(IndicatorReader):
     __slots__ = ('_enter_k_period', '_enter_smooth', '_enter_d_period',
-                 '_exit_k_period', '_exit_smooth', '_exit_d_period')
+                 '_exit_k_period', '_exit_smooth', '_exit_d_period',
+                 '_enter_stochastic', '_exit_stochastic')
 
     def __init__(self, asset: str, enter_interval: str, exit_interval: str,
                  enter_k_period: int, enter_smooth: int, enter_d_period: int,
@@ -92,16 +158,12 @@ class StochasticOscillatorReader(IndicatorReader):
         self._exit_k_period = exit_k_period
         self._exit_smooth = exit_smooth
         self._exit_d_period = exit_d_period
-        super().__init__(asset, enter_interval, exit_interval, prices_manager, indicator_manager)
-
-    # TODO properties for testing - remove later
-    @property
-    def enter_df(self):
-        return self._enter_df
 
-    @property
-    def exit_df(self):
-        return self._exit_df
+        self._enter_stochastic = technical_indicators.IncrementalStochasticOscillator(
+            k_period=enter_k_period, smooth=enter_smooth, d_period=enter_d_period)
+        self._exit_stochastic = technical_indicators.IncrementalStochasticOscillator(
+            k_period=exit_k_period, smooth=exit_smooth, d_period=exit_d_period)
+        super().__init__(asset, enter_interval, exit_interval, prices_manager, indicator_manager)
 
     def _get_n_ohlc_to_download(self) -> int:
         necessary_periods = max(
@@ -111,20 +173,23 @@ class StochasticOscillatorReader(IndicatorReader):
         # TODO calculate optimum num of records from DB
         return (necessary_periods * self._necessary_num_of_m1) + max_of_smooths + 20
 
-    def update_indicators(self) -> None:
-        if self._market_data_updated():
-            technical_indicators.StochasticOscillator.apply_full_stochastic_to_df(
-                df=self._enter_df,
-                k_period=self._enter_k_period,
-                smooth=self._enter_smooth,
-                d_period=self._enter_d_period)
-
-            technical_indicators.StochasticOscillator.apply_full_stochastic_to_df(
-                df=self._exit_df,
-                k_period=self._exit_k_period,
-                smooth=self._exit_smooth,
-                d_period=self._exit_d_period)
+    def _reset_indicators(self) -> None:
+        self._enter_stochastic.reset()
+        self._exit_stochastic.reset()
 
+    def _update_indicators_with_bar(self, timestamp: dt.datetime,
+                                    high: float, low: float,
+                                    close: float) -> None:
+        if is_interval_start(timestamp, self._num_of_enter_m1):
+            self._enter_stochastic.update(high, low, close)
+            self._hour = timestamp.hour
+
+        if is_interval_start(timestamp, self._num_of_exit_m1):
+            self._exit_stochastic.update(high, low, close)
+
+    def update_indicators(self) -> None:
+        if self._market_data_updated() and self._enter_stochastic.is_ready \
+                and self._exit_stochastic.is_ready:
             self._indicator_manager.log(
                 enter_k=self.current_enter_k,
                 enter_d=self.current_enter_d,
@@ -139,32 +204,32 @@ class StochasticOscillatorReader(IndicatorReader):
 
     @property
     def current_enter_k(self) -> float:
-        return self._enter_df['K'].iat[-1]
+        return self._enter_stochastic.k
 
     @property
     def current_enter_d(self) -> float:
-        return self._enter_df['D'].iat[-1]
+        return self._enter_stochastic.d
 
     @property
     def previous_enter_k(self) -> float:
-        return self._enter_df['K'].iat[-2]
+        return self._enter_stochastic.previous_k
 
     @property
     def previous_enter_d(self) -> float:
-        return self._enter_df['D'].iat[-2]
+        return self._enter_stochastic.previous_d
 
     @property
     def current_exit_k(self) -> float:
-        return self._exit_df['K'].iat[-1]
+        return self._exit_stochastic.k
 
     @property
     def current_exit_d(self) -> float:
-        return self._exit_df['D'].iat[-1]
+        return self._exit_stochastic.d
 
     @property
     def previous_exit_k(self) -> float:
-        return self._exit_df['K'].iat[-2]
+        return self._exit_stochastic.previous_k
 
     @property
     def previous_exit_d(self) -> float:
-        return self._exit_df['D'].iat[-2]
+        return self._exit_stochastic.previous_d
@@ -0,0 +1,139 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from databases.memory.memory_manager import (InMemoryPricesManager, InMemoryTransactionsManager,
+                                             InMemoryStochasticIndicatorManager)
+from databases.ohlc import OHLC
+from .broker_api import BrokerAPI
+from .trading_bot import TradingBot
+
+
+class SimulatedClock:
+    """ Clock set by replay engine, used instead of datetime.now """
+    __slots__ = ('_now', )
+
+    def __init__(self):
+        self._now: dt.datetime = None
+
+    def set(self, now: dt.datetime) -> None:
+        self._now = now
+
+    def now(self) -> dt.datetime:
+        return self._now
+
+
+class SimulatedBrokerAPI(BrokerAPI):
+    """ Broker API which does not make any transactions """
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__(auth_file_path='')
+        self.is_ready = True
+
+    def init(self) -> None:
+        pass
+
+    def go_long(self, asset: str, position_size: int) -> None:
+        pass
+
+    def go_short(self, asset: str, position_size: int) -> None:
+        pass
+
+
+class StrategyReplay:
+    """
+    Event driven replay of historical 1 minute bars through live
+    Strategy and TradingBot objects
+    Every bar is handled the same way as in main.py - it is inserted
+    to prices manager, passed to strategy and bot takes action one minute
+    after bar timestamp
+    """
+    __slots__ = ('_Strategy', '_strategy_params', '_asset', '_clock',
+                 '_prices_manager', '_transactions_manager',
+                 '_indicator_manager', '_results')
+
+    def __init__(self, Strategy, strategy_params: dict, asset: str = 'REPLAY'):
+        """
+        :param Strategy: live strategy class, for example StochasticOscillatorStrategy
+        :param strategy_params: strategy init params without asset, clock
+        and managers
+        """
+        self._Strategy = Strategy
+        self._strategy_params = strategy_params
+        self._asset = asset
+        self._clock = SimulatedClock()
+
+        self._prices_manager: InMemoryPricesManager = None
+        self._transactions_manager: InMemoryTransactionsManager = None
+        self._indicator_manager: InMemoryStochasticIndicatorManager = None
+        self._results = pd.DataFrame()
+
+    @property
+    def results(self) -> pd.DataFrame:
+        """
+        :return: pandas DataFrame with Close, Position taken after the bar
+        and Strategy percentage change columns
+        """
+        if self._results.empty:
+            raise ValueError('No results - use run method first')
+        return self._results
+
+    @property
+    def transactions(self) -> pd.DataFrame:
+        return self._transactions_manager.get_all_records(self._asset)
+
+    @property
+    def indicators(self) -> pd.DataFrame:
+        return self._indicator_manager.get_all_records(self._asset)
+
+    @property
+    def strategy_return(self) -> float:
+        return self.results['Strategy'].sum()
+
+    def _init_trading_bot(self, max_records: int) -> tuple:
+        """ :return: (strategy, trading bot) tuple """
+        self._prices_manager = InMemoryPricesManager(self._clock.now, max_records)
+        self._transactions_manager = InMemoryTransactionsManager(self._clock.now)
+        self._indicator_manager = InMemoryStochasticIndicatorManager(self._clock.now)
+
+        strategy = self._Strategy(
+            asset=self._asset, prices_manager=self._prices_manager,
+            indicator_manager=self._indicator_manager, clock=self._clock.now,
+            **self._strategy_params)
+        trading_bot = TradingBot(strategy_object=strategy,
+                                 broker_api_object=SimulatedBrokerAPI(),
+                                 transactions_manager=self._transactions_manager)
+        return strategy, trading_bot
+
+    def run(self, market_data: pd.DataFrame, max_records: int = 10000) -> None:
+        """
+        Replays market data bar by bar
+        :param market_data: 1 minute bars DataFrame with datetime index
+        and Open, High, Low, Close columns
+        :param max_records: number of last bars kept by prices manager
+        """
+        strategy, trading_bot = self._init_trading_bot(max_records)
+        one_minute = dt.timedelta(minutes=1)
+
+        positions = np.zeros(len(market_data), dtype=np.int8)
+        position = 0
+        for i, (timestamp, open_price, high, low, close) in enumerate(zip(
+                market_data.index.to_pydatetime(), market_data['Open'].values,
+                market_data['High'].values, market_data['Low'].values,
+                market_data['Close'].values)):
+            ohlc = OHLC(timestamp=timestamp, open=open_price, high=high,
+                        low=low, close=close)
+            self._clock.set(timestamp + one_minute)
+            self._prices_manager.insert_ohlc(ohlc, self._asset)
+            strategy.add_ohlc(ohlc)
+            position = trading_bot.take_action(position)
+            positions[i] = position
+
+        results = pd.DataFrame({'Close': market_data['Close'].values,
+                                'Position': positions},
+                               index=market_data.index)
+        results['Strategy'] = results['Close'].pct_change() * \
+            results['Position'].shift(1)
+        self._results = results
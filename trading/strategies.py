@@ -1,7 +1,9 @@
 import abc
 from datetime import datetime as dt
 
+from databases.bar_aggregator import interval_minutes
 from databases.indicators_manager import StochasticIndicatorManager
+from databases.ohlc import OHLC
 from databases.prices_manager import PricesManager
 from . import indicators_readers
 
@@ -11,8 +13,14 @@ class Strategy(abc.ABC):
     Implementation of Strategies Abstract class
     Contains logic for making transactions
     """
-    def __init__(self, asset: str, enter_interval: str, exit_interval: str, start_hour: int, end_hour: int):
+    def __init__(self, asset: str, enter_interval: str, exit_interval: str, start_hour: int, end_hour: int,
+                 clock=dt.now):
+        """
+        :param clock: function returning current datetime, simulated clock
+        can be used for replaying historical data
+        """
         self._asset = asset
+        self._clock = clock
         self._enter_interval = enter_interval
         self._exit_interval = exit_interval
         self._start_hour = start_hour
@@ -22,20 +30,25 @@ class Strategy(abc.ABC):
         self._indicator_manager = None
         self._indicator_reader = None
 
-        self._enter_minute = indicators_readers.n_minutes_dict[enter_interval]
-        self._exit_minute = indicators_readers.n_minutes_dict[exit_interval]
+        self._enter_minute = interval_minutes[enter_interval]
+        self._exit_minute = interval_minutes[exit_interval]
 
     @property
     def asset(self) -> str:
         return self._asset
 
+    def add_ohlc(self, ohlc: OHLC) -> None:
+        """ Passes new ohlc from live loop to indicator reader """
+        self._indicator_reader.add_ohlc(ohlc)
+
     def _check_enter_interval(self) -> bool:
-        current_minute = dt.now().minute
-        return current_minute % self._enter_minute == 1
+        """ First minute after interval bar is closed, every minute for '1T' """
+        current_minute = self._clock().minute
+        return current_minute % self._enter_minute == 1 % self._enter_minute
 
     def _check_exit_interval(self) -> bool:
-        current_minute = dt.now().minute
-        return current_minute % self._exit_minute == 1
+        current_minute = self._clock().minute
+        return current_minute % self._exit_minute == 1 % self._exit_minute
 
     @abc.abstractmethod
     def _got_take_long_signal(self) -> bool:
@@ -84,9 +97,10 @@ class StochasticOscillatorStrategy(Strategy):
     def __init__(self, asset: str, enter_interval: str, exit_interval: str, start_hour: int, end_hour: int,
                  enter_k_period: int, enter_smooth: int, enter_d_period: int, exit_k_period: int,
                  exit_smooth: int, exit_d_period: int, long_stoch_threshold: float, short_stoch_threshold: float,
-                 prices_manager: PricesManager, indicator_manager: StochasticIndicatorManager):
+                 prices_manager: PricesManager, indicator_manager: StochasticIndicatorManager,
+                 clock=dt.now):
         super().__init__(asset, enter_interval, exit_interval,
-                         start_hour, end_hour)
+                         start_hour, end_hour, clock)
 
         self._indicator_reader = indicators_readers.StochasticOscillatorReader(
             self._asset, self._enter_interval, self._exit_interval,
@@ -130,10 +144,11 @@ class StochasticExtendedStrategy(StochasticOscillatorStrategy):
     def __init__(self, asset: str, enter_interval: str, exit_interval: str, start_hour: int, end_hour: int,
                  enter_k_period: int, enter_smooth: int, enter_d_period: int, exit_k_period: int,
                  exit_smooth: int, exit_d_period: int, long_stoch_threshold: float, short_stoch_threshold: float,
-                 prices_manager: PricesManager, indicator_manager: StochasticIndicatorManager):
+                 prices_manager: PricesManager, indicator_manager: StochasticIndicatorManager,
+                 clock=dt.now):
         super().__init__(asset, enter_interval, exit_interval, start_hour, end_hour, enter_k_period, enter_smooth,
                          enter_d_period, exit_k_period, exit_smooth, exit_d_period, long_stoch_threshold,
-                         short_stoch_threshold, prices_manager, indicator_manager)
+                         short_stoch_threshold, prices_manager, indicator_manager, clock)
 
     def _got_take_long_signal(self) -> bool:
         return (self._indicator_reader.current_enter_k > self._indicator_reader.current_enter_d) & \
@@ -1,3 +1,6 @@
+import math
+from collections import deque
+
 import pandas as pd
 
 
@@ -8,18 +11,145 @@ class StochasticOscillator:
     __slots__ = ()
 
     @staticmethod
-    def apply_full_stochastic_to_df(df: pd.DataFrame, k_period: int,
-                                    smooth: int, d_period: int) -> None:
+    def calculate_full_stochastic(df: pd.DataFrame, k_period: int,
+                                  smooth: int, d_period: int) -> tuple:
         """
         Calculates full stochastic indicator
-        Adds K and D columns to received dataframe
+        :return: (K, D) tuple of pandas Series
         """
         low = df['Low'].rolling(window=k_period).min()
         high = df['High'].rolling(window=k_period).max()
 
         k_value = ((df['Close'] - low) / (high - low)) * 100
-        df.loc[:, 'K'] = k_value.rolling(window=smooth).mean()
-        df.loc[:, 'D'] = df['K'].rolling(window=d_period).mean()
+        k_line = k_value.rolling(window=smooth).mean()
+        d_line = k_line.rolling(window=d_period).mean()
+        return k_line, d_line
+
+    @staticmethod
+    def apply_full_stochastic_to_df(df: pd.DataFrame, k_period: int,
+                                    smooth: int, d_period: int) -> None:
+        """
+        Calculates full stochastic indicator
+        Adds K and D columns to received dataframe
+        """
+        k_line, d_line = StochasticOscillator.calculate_full_stochastic(
+            df, k_period, smooth, d_period)
+        df.loc[:, 'K'] = k_line
+        df.loc[:, 'D'] = d_line
+
+
+class IncrementalStochasticOscillator:
+    """
+    Streaming full stochastic indicator - every new bar is processed in O(1)
+    Rolling Low/High extremes are kept in monotonic deques, K smoothing
+    and D window are kept as running sums
+    Values are equal to apply_full_stochastic_to_df calculated over
+    the same bars
+    """
+    __slots__ = ('_k_period', '_smooth', '_d_period', '_n_bars',
+                 '_lows', '_highs', '_raw_k_window', '_raw_k_sum',
+                 '_raw_k_nans', '_k_window', '_k_sum', '_k_nans',
+                 'k', 'd', 'previous_k', 'previous_d')
+
+    def __init__(self, k_period: int, smooth: int, d_period: int):
+        self._k_period = k_period
+        self._smooth = smooth
+        self._d_period = d_period
+        self.reset()
+
+    def reset(self) -> None:
+        """ Clears all indicator state """
+        self._n_bars = 0
+        self._lows = deque()
+        self._highs = deque()
+
+        self._raw_k_window = deque()
+        self._raw_k_sum = 0.0
+        self._raw_k_nans = 0
+
+        self._k_window = deque()
+        self._k_sum = 0.0
+        self._k_nans = 0
+
+        self.k = math.nan
+        self.d = math.nan
+        self.previous_k = math.nan
+        self.previous_d = math.nan
+
+    @property
+    def is_ready(self) -> bool:
+        """ True when current and previous K and D values are calculated """
+        return not (math.isnan(self.k) or math.isnan(self.d) or
+                    math.isnan(self.previous_k) or
+                    math.isnan(self.previous_d))
+
+    def update(self, high: float, low: float, close: float) -> None:
+        """
+        Adds new bar to the indicator and recalculates K and D
+        """
+        index = self._n_bars
+        self._n_bars += 1
+
+        # Monotonic deques - front keeps extreme of current window
+        while self._lows and self._lows[-1][1] >= low:
+            self._lows.pop()
+        self._lows.append((index, low))
+        while self._highs and self._highs[-1][1] <= high:
+            self._highs.pop()
+        self._highs.append((index, high))
+
+        window_start = index - self._k_period + 1
+        if self._lows[0][0] < window_start:
+            self._lows.popleft()
+        if self._highs[0][0] < window_start:
+            self._highs.popleft()
+
+        if window_start < 0:
+            raw_k = math.nan
+        else:
+            raw_k = self._calculate_raw_k(
+                close, self._lows[0][1], self._highs[0][1])
+
+        self.previous_k = self.k
+        self.previous_d = self.d
+
+        self.k, self._raw_k_sum, self._raw_k_nans = self._rolling_mean(
+            self._raw_k_window, raw_k, self._raw_k_sum,
+            self._raw_k_nans, self._smooth)
+        self.d, self._k_sum, self._k_nans = self._rolling_mean(
+            self._k_window, self.k, self._k_sum,
+            self._k_nans, self._d_period)
+
+    @staticmethod
+    def _calculate_raw_k(close: float, low: float, high: float) -> float:
+        """ Flat window (High == Low) gives NaN, same as pandas 0 / 0 """
+        if high == low:
+            return math.nan
+        return ((close - low) / (high - low)) * 100
+
+    @staticmethod
+    def _rolling_mean(window: deque, value: float, window_sum: float,
+                      n_nans: int, period: int) -> tuple:
+        """
+        Pushes value to running sum window, returns (mean, sum, n_nans)
+        Mean is NaN until the window is full or while it contains NaN
+        """
+        if math.isnan(value):
+            n_nans += 1
+        else:
+            window_sum += value
+        window.append(value)
+
+        if len(window) > period:
+            old_value = window.popleft()
+            if math.isnan(old_value):
+                n_nans -= 1
+            else:
+                window_sum -= old_value
+
+        if n_nans == 0 and len(window) == period:
+            return window_sum / period, window_sum, n_nans
+        return math.nan, window_sum, n_nans
 
 
 class SimpleMovingAverage: